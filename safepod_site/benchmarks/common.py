@@ -0,0 +1,56 @@
+"""Helpers shared by the benchmark scripts"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def setup_django(database_file=None):
+    """
+    Set up Django with a throwaway test database, returns a teardown callable.
+    With database_file an SQLite test database is kept in that file rather
+    than in memory, so that forked processes can share it.
+    """
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import django
+    django.setup()
+
+    from django.db import connection
+    if database_file and connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = database_file
+
+    from django.test.runner import DiscoverRunner
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    return lambda: runner.teardown_databases(old_config)
+
+
+def request_host():
+    """A host the current settings accept"""
+    from django.conf import settings
+    return settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+
+
+def create_forum(posts=20, comments=10, tags=5):
+    """Fill the database with a small forum, returns the ids of the posts"""
+    from forum.models import AppUser, Comment, Post, Tag
+
+    users = [AppUser.objects.create(id='bench-user-%d' % i) for i in range(10)]
+    tag_objs = [Tag.objects.create(name='Tag %d' % i, slug='tag-%d' % i) for i in range(tags)]
+    post_ids = []
+    for i in range(posts):
+        post = Post.objects.create(body='Benchmark post %d ' % i * 20, app_user=users[i % len(users)])
+        post.tags.add(*tag_objs[:1 + i % tags])
+        for j in range(comments):
+            Comment.objects.create(body='Comment %d' % j, app_user=users[j % len(users)], post=post)
+        post_ids.append(post.pk)
+    return post_ids
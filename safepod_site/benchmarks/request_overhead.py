@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Per-request framework overhead benchmark.
+
+For each settings profile, in a fresh interpreter with a throwaway test
+database, times forum requests through the full request handler
+(middleware, URL resolution, response processing) and calls to the
+resolved view alone. The difference is what the profile's middleware and
+request machinery cost per request.
+
+    python benchmarks/request_overhead.py --settings safepod_site.settings.dev \
+        --settings safepod_site.settings.api_dev --requests 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import ROOT, create_forum, median, request_host, setup_django
+
+
+def child(count):
+    teardown = setup_django()
+    try:
+        from django.core.handlers.wsgi import WSGIHandler
+        from django.core.urlresolvers import resolve
+        from django.test import RequestFactory
+        from safepod_site.settings.secrets import get_secret_key
+
+        post_ids = create_forum(posts=20, comments=5)
+        sign = get_secret_key("APP_ID")
+        paths = {
+            'posts_index': '/forum/?sign=%s' % sign,
+            'post_detail': '/forum/post/%d/?sign=%s&userid=bench-user-1' % (post_ids[0], sign),
+            'all_tags': '/forum/tag/?sign=%s' % sign,
+            # Rejected before any query, isolates the framework cost
+            'unsigned': '/forum/',
+        }
+
+        handler = WSGIHandler()
+        handler.load_middleware()
+        factory = RequestFactory(HTTP_HOST=request_host())
+
+        results = {}
+        for name, path in paths.items():
+            match = resolve(path.split('?')[0])
+
+            def bare():
+                request = factory.get(path)
+                return match.func(request, *match.args, **match.kwargs)
+
+            def full():
+                return handler.get_response(factory.get(path))
+
+            timings = {}
+            for label, call in (('view', bare), ('handler', full)):
+                # Warm up caches and lazy imports before timing
+                for _ in range(20):
+                    call()
+                samples = []
+                for _ in range(count):
+                    start = time.time()
+                    call()
+                    samples.append(time.time() - start)
+                timings[label] = median(samples)
+            results[name] = timings
+        sys.stdout.write(json.dumps(results) + '\n')
+    finally:
+        teardown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-request middleware overhead per settings profile")
+    parser.add_argument('--settings', action='append', help="settings module, may be repeated")
+    parser.add_argument('--requests', type=int, default=1000, help="timed requests per endpoint")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.child)
+
+    for settings_module in args.settings or ['safepod_site.settings.dev', 'safepod_site.settings.api_dev']:
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', str(args.requests)],
+                                         env=env, cwd=ROOT)
+        results = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        print("%s (median us per request)" % settings_module)
+        print("  %-14s %10s %10s %10s" % ('endpoint', 'view', 'handler', 'overhead'))
+        for name in sorted(results):
+            view, full = results[name]['view'], results[name]['handler']
+            print("  %-14s %10.1f %10.1f %10.1f" % (name, 1e6 * view, 1e6 * full, 1e6 * (full - view)))
+        print("")
+
+
+if __name__ == '__main__':
+    main()
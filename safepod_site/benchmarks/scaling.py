@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Multi-process scaling benchmark.
+
+Serves the forum from N pre-forked worker processes sharing one listening
+socket, the way gunicorn runs them (see gunicorn_conf.py), and loads them
+with 2 x N client processes for a fixed time. Throughput is reported for
+each worker count next to the speedup over one worker and the scaling
+efficiency (speedup / workers); with one core per worker and enough cores
+left for the clients, efficiency should stay close to 1.
+
+    python benchmarks/scaling.py --settings safepod_site.settings.api_dev \
+        --workers 1 --workers 2 --workers 4 --seconds 10
+
+Workers are single threaded and the database is an SQLite file, so the
+numbers show how the application itself scales across cores, not the
+database. The clients run on the same machine; on a box with fewer than
+3 x N cores they compete with the workers and the curve flattens.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+from common import create_forum, setup_django
+
+
+def serve(server):
+    """Worker process: accept on the shared socket until terminated"""
+    signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+    server.serve_forever()
+
+
+def load(port, paths, seconds, results):
+    """Client process: request the paths in turn until time is up"""
+    done = errors = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        connection = HTTPConnection('127.0.0.1', port)
+        connection.request('GET', paths[done % len(paths)])
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        if response.status == 200:
+            done += 1
+        else:
+            errors += 1
+    results.put((done, errors))
+
+
+def measure(server, paths, workers, clients, seconds):
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            serve(server)
+        pids.append(pid)
+    try:
+        # Wait until a worker answers before starting the clock
+        connection = HTTPConnection('127.0.0.1', server.server_port)
+        connection.request('GET', '/readyz')
+        connection.getresponse().read()
+
+        results = multiprocessing.Queue()
+        loaders = [multiprocessing.Process(target=load, args=(server.server_port, paths, seconds, results))
+                   for _ in range(clients)]
+        for loader in loaders:
+            loader.start()
+        totals = [results.get() for _ in loaders]
+        for loader in loaders:
+            loader.join()
+    finally:
+        for pid in pids:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+    return sum(done for done, errors in totals) / float(seconds), sum(errors for done, errors in totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput as the number of worker processes grows")
+    parser.add_argument('--settings', default='safepod_site.settings.api_dev', help="settings module")
+    parser.add_argument('--workers', type=int, action='append', help="worker processes, may be repeated")
+    parser.add_argument('--clients-per-worker', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    directory = tempfile.mkdtemp()
+    teardown = setup_django(database_file=os.path.join(directory, 'bench.sqlite3'))
+    try:
+        from wsgiref.simple_server import WSGIRequestHandler, make_server
+        from django.conf import settings
+        from django.db import connections
+        from safepod_site.settings.secrets import get_secret_key
+        from safepod_site.wsgi import application
+
+        # Production-like: no debug cursors or per-request logging in the workers
+        settings.DEBUG = False
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        post_ids = create_forum(posts=50, comments=5)
+        sign = get_secret_key("APP_ID")
+        paths = ['/forum/?sign=%s&userid=bench-user-1' % sign,
+                 '/forum/post/%d/?sign=%s&userid=bench-user-2' % (post_ids[0], sign),
+                 '/forum/tag/?sign=%s' % sign,
+                 '/forum/tag/tag-1/?sign=%s' % sign]
+        # Workers open their own connections after the fork
+        for connection in connections.all():
+            connection.close()
+
+        server = make_server('127.0.0.1', 0, application, handler_class=QuietHandler)
+
+        levels = args.workers or sorted(set([1, 2, multiprocessing.cpu_count()]))
+        print("%d cores, %s, %.0fs per run" % (multiprocessing.cpu_count(), args.settings, args.seconds))
+        print("  %8s %8s %10s %8s %10s %7s" % ('workers', 'clients', 'req/s', 'speedup', 'efficiency', 'errors'))
+        base = None
+        for workers in levels:
+            clients = workers * args.clients_per_worker
+            rate, errors = measure(server, paths, workers, clients, args.seconds)
+            base = base or rate / workers
+            print("  %8d %8d %10.1f %8.2f %10.2f %7d" % (workers, clients, rate, rate / base,
+                                                        rate / base / workers, errors))
+        server.server_close()
+    finally:
+        teardown()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Worker startup benchmark.
+
+Starts fresh interpreters and measures what a recycled worker pays before
+it can answer its first request: importing the settings, django.setup()
+(app registry and admin autodiscovery), loading the URLconf and serving the
+first forum request. Import time is also attributed to individual modules
+(self time, excluding nested imports) so regressions can be traced.
+
+    python benchmarks/startup.py --settings safepod_site.settings.dev \
+        --settings safepod_site.settings.api_dev --runs 10 --budget 400
+
+Exits non-zero if the median total of any profile exceeds --budget ms.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import ROOT, median
+
+PHASES = ['settings', 'setup', 'urlconf', 'first_request']
+
+
+def child(path):
+    """Runs inside the fresh interpreter, prints one JSON line of timings"""
+    try:
+        import __builtin__ as builtins
+    except ImportError:
+        import builtins
+
+    own = {}
+    stack = [0.0]
+    original_import = builtins.__import__
+
+    # Time every first import of a module; nested imports are subtracted from the parent
+    def timed_import(name, *args, **kwargs):
+        if name in sys.modules:
+            return original_import(name, *args, **kwargs)
+        stack.append(0.0)
+        start = time.time()
+        try:
+            return original_import(name, *args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            nested = stack.pop()
+            if elapsed - nested > 0:
+                own[name] = own.get(name, 0.0) + elapsed - nested
+            stack[-1] += elapsed
+
+    builtins.__import__ = timed_import
+    sys.path.insert(0, ROOT)
+
+    timings = {}
+    start = time.time()
+    from django.conf import settings
+    settings.INSTALLED_APPS
+    timings['settings'] = time.time() - start
+
+    mark = time.time()
+    import django
+    django.setup()
+    timings['setup'] = time.time() - mark
+
+    mark = time.time()
+    from django.core.urlresolvers import get_resolver
+    get_resolver().resolve(path)
+    timings['urlconf'] = time.time() - mark
+
+    # Only the handler and view code paths, no database is needed for a rejected signature
+    mark = time.time()
+    from django.test import RequestFactory
+    from django.core.handlers.wsgi import WSGIHandler
+    handler = WSGIHandler()
+    handler.load_middleware()
+    host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost'
+    handler.get_response(RequestFactory().get(path, HTTP_HOST=host))
+    timings['first_request'] = time.time() - mark
+
+    timings['total'] = time.time() - start
+    builtins.__import__ = original_import
+    sys.stdout.write(json.dumps({'timings': timings, 'modules': own}) + '\n')
+
+
+def run(settings_module, runs, path):
+    samples = []
+    for _ in range(runs):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', path],
+                                         env=env, cwd=ROOT)
+        samples.append(json.loads(output.decode('utf-8').strip().splitlines()[-1]))
+    return samples
+
+
+def report(settings_module, samples, top):
+    print("%s (%d runs, median ms)" % (settings_module, len(samples)))
+    for phase in PHASES + ['total']:
+        print("  %-14s %8.1f" % (phase, 1000 * median([s['timings'][phase] for s in samples])))
+
+    modules = {}
+    for sample in samples:
+        for name, seconds in sample['modules'].items():
+            modules.setdefault(name, []).append(seconds)
+    slowest = sorted(modules.items(), key=lambda item: -median(item[1]))[:top]
+    print("  slowest imports (self time):")
+    for name, seconds in slowest:
+        print("    %-50s %8.2f" % (name, 1000 * median(seconds)))
+    return 1000 * median([s['timings']['total'] for s in samples])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker startup time per settings profile")
+    parser.add_argument('--settings', action='append', help="settings module, may be repeated")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="number of modules to list")
+    parser.add_argument('--path', default='/forum/', help="url of the first request")
+    parser.add_argument('--budget', type=float, help="fail if the median total exceeds this many ms")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args.child)
+
+    over_budget = False
+    for settings_module in args.settings or ['safepod_site.settings.dev']:
+        total = report(settings_module, run(settings_module, args.runs, args.path), args.top)
+        if args.budget is not None and total > args.budget:
+            print("  over budget: %.1f ms > %.1f ms" % (total, args.budget))
+            over_budget = True
+        print("")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,118 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
 
 from .models import Post, Tag, Comment, AppUser
+from .moderation import ban_users, unpublish_comments, unpublish_posts
+
+# Below this many rows the exact count is cheap enough
+ESTIMATE_COUNT_ABOVE = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator using the planner's row estimate for unfiltered changelists.
+
+    A full COUNT(*) scans the whole table on Postgres, pg_class.reltuples is
+    a catalog lookup. Filtered changelists, and other databases, still get
+    the exact count.
+    """
+
+    def _get_count(self):
+        if self._count is None:
+            query = self.object_list.query
+            if connection.vendor == 'postgresql' and not query.where.children:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s",
+                                   [self.object_list.model._meta.db_table])
+                    row = cursor.fetchone()
+                if row and row[0] > ESTIMATE_COUNT_ABOVE:
+                    self._count = int(row[0])
+            if self._count is None:
+                self._count = self.object_list.count()
+        return self._count
+    count = property(_get_count)
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Changelist defaults for tables that grow without bound"""
+    paginator = EstimatedCountPaginator
+    # Skip the second, unfiltered COUNT(*) per changelist page
+    show_full_result_count = False
+    list_per_page = 50
+
+    # Exact matches on the primary key or the author only, both are indexed
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        query = Q(**{self.author_field: term})
+        if term.isdigit():
+            query |= Q(pk=int(term))
+        return queryset.filter(query), False
+
+
+class PostAdmin(ScalableAdmin):
+    list_display = ('id', 'created', 'published', 'likes', 'dislikes', 'app_user')
+    list_select_related = ('app_user',)
+    list_filter = ('published', 'created', 'tags')
+    search_fields = ('=id', '=app_user__id')
+    author_field = 'app_user_id'
+    raw_id_fields = ('app_user', 'liked', 'disliked', 'tags')
+    actions = ['unpublish', 'ban_authors']
+
+    def unpublish(self, request, queryset):
+        count = unpublish_posts(queryset.values_list('id', flat=True))
+        self.message_user(request, "%d posts unpublished" % count)
+    unpublish.short_description = "Unpublish selected posts"
+
+    def ban_authors(self, request, queryset):
+        count = ban_users(queryset.values_list('app_user_id', flat=True).distinct())
+        self.message_user(request, "%d users banned, all their posts and comments hidden" % count)
+    ban_authors.short_description = "Ban authors and hide all their content"
 
-class PostAdmin(admin.ModelAdmin):
-    prepopulated_fields = {}   
 
 class TagAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("name",)}
+    list_display = ('name', 'slug', 'post_count', 'last_post')
     
-class CommentAdmin(admin.ModelAdmin):
-    prepopulated_fields = {}   
+class CommentAdmin(ScalableAdmin):
+    list_display = ('id', 'created', 'published', 'likes', 'dislikes', 'app_user', 'post_ref')
+    list_select_related = ('app_user',)
+    list_filter = ('published', 'created')
+    search_fields = ('=id', '=app_user__id')
+    author_field = 'app_user_id'
+    raw_id_fields = ('app_user', 'post', 'liked', 'disliked')
+    actions = ['unpublish', 'ban_authors']
+
+    # The id alone, rendering the post would load it for every row
+    def post_ref(self, obj):
+        return obj.post_id
+    post_ref.short_description = "Post"
+    post_ref.admin_order_field = 'post'
+
+    def unpublish(self, request, queryset):
+        count = unpublish_comments(queryset.values_list('id', flat=True))
+        self.message_user(request, "%d comments unpublished" % count)
+    unpublish.short_description = "Unpublish selected comments"
+
+    def ban_authors(self, request, queryset):
+        count = ban_users(queryset.values_list('app_user_id', flat=True).distinct())
+        self.message_user(request, "%d users banned, all their posts and comments hidden" % count)
+    ban_authors.short_description = "Ban authors and hide all their content"
+
+class AppUserAdmin(ScalableAdmin):
+    list_display = ('id', 'banned')
+    list_filter = ('banned',)
+    search_fields = ('=id',)
+    author_field = 'id'
+    actions = ['ban']
 
-class AppUserAdmin(admin.ModelAdmin):
-    prepopulated_fields = {}
+    def ban(self, request, queryset):
+        count = ban_users(queryset.values_list('id', flat=True))
+        self.message_user(request, "%d users banned, all their posts and comments hidden" % count)
+    ban.short_description = "Ban selected users and hide all their content"
 
 admin.site.register(Post,PostAdmin)
 admin.site.register(Tag,TagAdmin)
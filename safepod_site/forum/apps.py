@@ -5,3 +5,7 @@ from django.apps import AppConfig
 
 class ForumConfig(AppConfig):
     name = 'forum'
+
+    def ready(self):
+        from . import signals
+        signals.connect()
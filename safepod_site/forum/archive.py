@@ -0,0 +1,106 @@
+"""
+Cold storage for old, inactive threads.
+
+The archive_threads command moves threads whose post is older than a cutoff
+and whose comments have all gone quiet into ArchivedThread: one row per
+thread holding a JSON document of the post, its tags, its comments and the
+votes on all of them. The hot Post and Comment tables (and their indexes)
+then only hold the recent working set, while PostDetailView still answers
+for archived ids from the document, read-only.
+"""
+import json
+
+from django.db import transaction
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+from .catalog import recount_tags, tag_catalog
+from .feed import evict_tags
+from .models import ArchivedThread, Comment, Post
+from .serializers import Records, VOTABLE_FIELDS
+from .signals import tags_recounted_in_bulk
+
+
+def votable_document(obj):
+    return {'id': obj.pk,
+            'body': obj.body,
+            'published': obj.published,
+            'created': obj.created.isoformat(),
+            'likes': obj.likes,
+            'dislikes': obj.dislikes,
+            'app_user': obj.app_user_id,
+            'liked': [user.id for user in obj.liked.all()],
+            'disliked': [user.id for user in obj.disliked.all()],
+            }
+
+
+def inactive_threads(created_before, active_since):
+    """Published posts created before the first cutoff without comments since the second one"""
+    # Unpublished posts stay where moderation left them
+    return (Post.objects.filter(published=True, created__lt=created_before)
+                        .exclude(comment__created__gte=active_since)
+                        .order_by('created'))
+
+
+def archive_posts(post_ids):
+    """Move the given threads into the archive, returns how many were moved"""
+    with transaction.atomic():
+        posts = list(Post.objects.filter(id__in=post_ids).prefetch_related('tags', 'liked', 'disliked'))
+        comments = {}
+        for comment in (Comment.objects.filter(post_id__in=post_ids)
+                                       .order_by('-created')
+                                       .prefetch_related('liked', 'disliked')):
+            comments.setdefault(comment.post_id, []).append(votable_document(comment))
+
+        archived = []
+        for post in posts:
+            document = votable_document(post)
+            document['tags'] = [tag.name for tag in post.tags.all()]
+            document['comments'] = comments.get(post.pk, [])
+            archived.append(ArchivedThread(id=post.pk, created=post.created, document=json.dumps(document)))
+
+        ArchivedThread.objects.bulk_create(archived)
+        # Comments and vote links go with the posts, the tags are recounted once for the whole batch
+        tag_ids = list(Post.tags.through.objects.filter(post_id__in=post_ids)
+                                                .values_list('tag_id', flat=True).distinct())
+        with tags_recounted_in_bulk():
+            Post.objects.filter(id__in=[post.pk for post in posts]).delete()
+        recount_tags(tag_ids)
+        tag_catalog.expire()
+        evict_tags(tag_ids)
+    return len(posts)
+
+
+def archive_inactive(created_before, active_since, batch_size=500):
+    """Archive every inactive thread batch by batch, yields the running total"""
+    total = 0
+    while True:
+        post_ids = list(inactive_threads(created_before, active_since).values_list('id', flat=True)[:batch_size])
+        if not post_ids:
+            return
+        total += archive_posts(post_ids)
+        yield total
+
+
+def votable_from_document(document, userid):
+    return {'body': document['body'],
+            'id': document['id'],
+            'created': parse_datetime(document['created']),
+            'likes': document['likes'],
+            'dislikes': document['dislikes'],
+            'posted': document['app_user'] == userid,
+            'liked': userid in document['liked'],
+            'disliked': userid in document['disliked'],
+            }
+
+
+def archived_post_detail(thread, userid):
+    """Same shape as serializers.post_detail, built from the archived document, raises Http404 if unpublished"""
+    document = json.loads(thread.document)
+    if not document['published']:
+        raise Http404
+    result = votable_from_document(document, userid)
+    result['tags'] = document['tags']
+    result['comments'] = Records(VOTABLE_FIELDS, [votable_from_document(item, userid)
+                                                  for item in document['comments'] if item['published']])
+    return result
@@ -0,0 +1,115 @@
+"""
+Precomputed tag catalog.
+
+Each Tag row carries a denormalised published post count and the time of its
+latest published post. Those columns are kept up to date incrementally by the
+receivers in forum.signals, and the catalog itself is served from an
+in-process snapshot that is refreshed in the background once it goes stale
+(stale-while-revalidate), so AllTagsView never waits on the database once the
+worker is warm.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q, Max
+
+from .models import Post, Tag
+from .serializers import Records, TAG_FIELDS
+
+
+# Incremental maintenance of the denormalised columns on Tag
+
+def add_post_to_tags(post, tag_ids):
+    """Count a freshly tagged (or republished) post against the given tags"""
+    if not tag_ids:
+        return
+    tags = Tag.objects.filter(pk__in=tag_ids)
+    tags.update(post_count=F('post_count') + 1)
+    tags.filter(Q(last_post__isnull=True) | Q(last_post__lt=post.created)).update(last_post=post.created)
+
+
+def recount_tags(tag_ids):
+    """Recompute count and last post time for the given tags from scratch"""
+    for tag_id in set(tag_ids):
+        posts = Post.objects.filter(published=True, tags__id=tag_id)
+        Tag.objects.filter(pk=tag_id).update(post_count=posts.count(),
+                                             last_post=posts.aggregate(last=Max('created'))['last'])
+
+
+def rebuild_catalog():
+    """Recompute the denormalised columns of every tag"""
+    recount_tags(Tag.objects.values_list('id', flat=True))
+    tag_catalog.expire()
+
+
+class TagCatalog(object):
+    """
+    In-process snapshot of the tag catalog.
+
+    The first read in a worker loads the snapshot synchronously. After that,
+    reads always return the current snapshot immediately; if it is older than
+    ``ttl`` seconds (or was expired by a write) a single background thread
+    reloads it while readers keep getting the stale copy.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._results = None
+        self._loaded_at = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the catalog from the database"""
+        return Records(TAG_FIELDS, [{'tag': item['name'],
+                                     'slug': item['slug'],
+                                     'description': item['description'],
+                                     'posts': item['post_count'],
+                                     'last_post': item['last_post'],
+                                     }
+                                    for item in Tag.objects.values('name', 'slug', 'description', 'post_count', 'last_post')])
+
+    def refresh(self):
+        """Reload the snapshot synchronously"""
+        results = self.load()
+        with self._lock:
+            self._results = results
+            self._loaded_at = time.time()
+
+    def expire(self):
+        """Mark the snapshot stale so the next read revalidates it"""
+        with self._lock:
+            self._loaded_at = 0
+
+    def get(self):
+        """Return the catalog, revalidating in the background when stale"""
+        with self._lock:
+            results = self._results
+            stale = time.time() - self._loaded_at > self.ttl
+            start = results is not None and stale and not self._refreshing
+            if start:
+                self._refreshing = True
+
+        if results is None:
+            self.refresh()
+            return self._results
+
+        if start:
+            worker = threading.Thread(target=self._background_refresh)
+            worker.daemon = True
+            worker.start()
+        return results
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+            # The thread got its own connection, don't leak it
+            connection.close()
+
+
+tag_catalog = TagCatalog(ttl=getattr(settings, 'FORUM_TAG_CATALOG_TTL', 60))
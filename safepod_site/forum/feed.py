@@ -0,0 +1,125 @@
+"""
+Personal feed: the newest posts in the tags a user follows.
+
+Feeds are built when read (fan-out on read). Every tag has a short index of
+its newest published posts, (created, id) pairs newest first, kept in the
+FORUM_FEED_CACHE cache; it is shared by all followers of the tag and dropped
+by the receivers in forum.signals whenever a post enters or leaves the tag.
+
+A user's feed is a k-way merge of the indexes of the tags they follow, cut
+at FORUM_FEED_SIZE posts, and is cached per user for FORUM_FEED_TTL seconds.
+Once it is older than FORUM_FEED_REFRESH seconds only the entries newer than
+its head are merged in. Either way a feed costs one cache round trip and at
+most FORUM_FEED_SIZE entries per followed tag, however busy the tags are.
+
+Those refreshes only ever add posts, so they do not extend the lifetime of a
+feed: FORUM_FEED_TTL seconds after it was built it is merged afresh, which
+picks up older posts that were tagged later and fills the places of posts
+that were unpublished or archived. The views rebuild it at once when they
+find such places, see ``forget_feed``.
+"""
+import calendar
+import heapq
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import AppUser, Post
+from .votes import user_hash
+
+
+def cache():
+    return caches[getattr(settings, 'FORUM_FEED_CACHE', 'default')]
+
+
+def tag_key(tag_id):
+    return 'forum:feed:tag:%d' % tag_id
+
+
+def user_key(userid):
+    return 'forum:feed:user:%s' % user_hash(userid)
+
+
+# Entries are (microseconds since the epoch, id) so that they sort and merge as plain ints
+def entry(created, pk):
+    return calendar.timegm(created.utctimetuple()) * 1000000 + created.microsecond, pk
+
+
+def load_tag_index(tag_id, size):
+    """Newest published posts of the tag, newest first"""
+    posts = Post.objects.filter(published=True, tags__id=tag_id).order_by('-created', '-id')
+    return [entry(created, pk) for created, pk in posts.values_list('created', 'id')[:size]]
+
+
+def tag_indexes(tag_ids, size):
+    """Indexes of the given tags, from the cache where possible"""
+    keys = dict((tag_key(tag_id), tag_id) for tag_id in tag_ids)
+    indexes = cache().get_many(keys.keys())
+    missing = {}
+    for key, tag_id in keys.items():
+        if key not in indexes:
+            indexes[key] = missing[key] = load_tag_index(tag_id, size)
+    if missing:
+        cache().set_many(missing, getattr(settings, 'FORUM_FEED_TTL', 300))
+    return list(indexes.values())
+
+
+def evict_tags(tag_ids):
+    """Drop the indexes of tags a post entered or left"""
+    cache().delete_many([tag_key(tag_id) for tag_id in set(tag_ids)])
+
+
+def merge_newest(indexes, size, after=None):
+    """
+    Merge lists of entries sorted newest first into one, without duplicates,
+    stopping after size entries or at the first one not newer than after.
+    """
+    merged = []
+    # heapq.merge is lazy and ascending, so the entries are negated on the way in
+    for stamp, pk in heapq.merge(*[((-stamp, -pk) for stamp, pk in index) for index in indexes]):
+        current = (-stamp, -pk)
+        if after is not None and current <= after:
+            break
+        if merged and merged[-1] == current:
+            continue
+        merged.append(current)
+        if len(merged) == size:
+            break
+    return merged
+
+
+def followed_tags(userid):
+    return list(AppUser.followed_tags.through.objects.filter(appuser_id=userid).values_list('tag_id', flat=True))
+
+
+def user_feed(userid):
+    """Ids of the newest posts in the tags the user follows, newest first"""
+    if not userid:
+        return []
+    size = getattr(settings, 'FORUM_FEED_SIZE', 50)
+    key = user_key(userid)
+    ttl = getattr(settings, 'FORUM_FEED_TTL', 300)
+    feed = cache().get(key)
+    now = time.time()
+
+    if feed is not None and now - feed['checked'] < getattr(settings, 'FORUM_FEED_REFRESH', 30):
+        return [pk for stamp, pk in feed['entries']]
+    if feed is None or now - feed['built'] >= ttl:
+        tag_ids, built = followed_tags(userid), now
+        entries = merge_newest(tag_indexes(tag_ids, size), size)
+    else:
+        # Only what was posted since the feed was built is merged in
+        tag_ids, entries, built = feed['tags'], feed['entries'], feed['built']
+        newer = merge_newest(tag_indexes(tag_ids, size), size, after=entries[0] if entries else None)
+        entries = merge_newest([newer, entries], size)
+
+    # Expires ttl seconds after it was built, however often it was refreshed since
+    cache().set(key, {'tags': tag_ids, 'entries': entries, 'built': built, 'checked': now},
+                max(1, int(round(built + ttl - now))))
+    return [pk for stamp, pk in entries]
+
+
+def forget_feed(userid):
+    """Drop the user's feed, the next read merges it afresh"""
+    cache().delete(user_key(userid))
@@ -0,0 +1,87 @@
+"""
+Per-worker cache of assembled post details.
+
+Popular threads are read far more often than they change, so the user
+agnostic part of a post detail (body, counters, tags, comments, see
+serializers.post_detail_base) is kept in a size-bounded LRU and only the
+cheap per-user vote overlay is computed per request. Entries are evicted by
+the Post, Comment, tag and vote signal receivers in forum.signals; those
+only fire in the worker that made the change, so entries also expire after
+FORUM_POST_CACHE_TTL seconds to bound staleness across workers.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import Post
+from .serializers import post_detail_base
+
+
+class LRUCache(object):
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every eviction so that a value read before it is not stored after it
+        self._generation = 0
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                return None
+            # Re-insert as the most recently used
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+post_details = LRUCache(getattr(settings, 'FORUM_POST_CACHE_SIZE', 1000),
+                        getattr(settings, 'FORUM_POST_CACHE_TTL', 30))
+
+
+def get_post_detail(pk):
+    """User agnostic detail of the post, raises Post.DoesNotExist"""
+    pk = int(pk)
+    detail = post_details.get(pk)
+    if detail is None:
+        generation = post_details.generation()
+        # Through all() so that unpublished posts stay hidden
+        detail = post_detail_base(Post.objects.all().prefetch_related('tags').get(pk=pk))
+        post_details.set(pk, detail, generation)
+    return detail
+
+
+def evict_post(pk):
+    post_details.delete(pk)
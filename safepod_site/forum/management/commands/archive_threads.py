@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from forum.archive import archive_inactive, inactive_threads
+
+
+class Command(BaseCommand):
+    help = "Move old threads without recent comments into the archive (cold storage)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=365,
+                            help="archive posts created more than this many days ago")
+        parser.add_argument('--inactive-for', type=int, default=90,
+                            help="only if there was no comment for this many days")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="only count the threads to archive")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        created_before = now - timedelta(days=options['older_than'])
+        active_since = now - timedelta(days=options['inactive_for'])
+
+        if options['dry_run']:
+            count = inactive_threads(created_before, active_since).count()
+            self.stdout.write("%d threads would be archived" % count)
+            return
+
+        total = 0
+        for total in archive_inactive(created_before, active_since, options['batch_size']):
+            self.stdout.write("Archived %d threads" % total)
+        self.stdout.write("Done, %d threads archived" % total)
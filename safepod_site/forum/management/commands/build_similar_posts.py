@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from forum import similar
+
+
+class Command(BaseCommand):
+    help = "Update the similar posts index with posts published or removed since the last build"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="tokenize every post again, e.g. after edits")
+        parser.add_argument('--neighbours', type=int, default=settings.FORUM_SIMILAR_NEIGHBOURS,
+                            help="similar posts stored per post")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not similar.available():
+            raise CommandError("The similar posts index needs numpy and scipy")
+
+        posts, added, removed = similar.build_index(settings.FORUM_SIMILAR_DIR, options['neighbours'],
+                                                    full=options['full'], batch_size=options['batch_size'])
+        self.stdout.write("Indexed %d posts (%d added, %d removed)" % (posts, added, removed))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from forum.transfer import export_records, open_dump
+
+
+class Command(BaseCommand):
+    help = "Stream posts, comments, tags, users and votes to an NDJSON file (gzip if it ends in .gz)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="output file, - for stdout")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        out = open_dump(options['path'], 'w')
+        try:
+            counts = export_records(out, options['batch_size'], self.progress)
+        finally:
+            if options['path'] != '-':
+                out.close()
+        self.stderr.write("Exported %d records" % sum(counts.values()))
+
+    # Progress goes to stderr so that stdout can carry the dump
+    def progress(self, name, count):
+        self.stderr.write("%s: %d" % (name, count))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from forum.transfer import import_records, open_dump
+
+
+class Command(BaseCommand):
+    help = "Load an export_forum NDJSON file (gzip if it ends in .gz) into an empty, migrated database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="input file, - for stdin")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        lines = open_dump(options['path'], 'r')
+        try:
+            counts = import_records(lines, options['batch_size'], self.progress)
+        finally:
+            if options['path'] != '-':
+                lines.close()
+        self.stderr.write("Imported %d records" % sum(counts.values()))
+
+    def progress(self, name, count):
+        self.stderr.write("%s: %d" % (name, count))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from forum.catalog import rebuild_catalog
+
+
+class Command(BaseCommand):
+    help = "Recompute the post count and last post time of every tag"
+
+    def handle(self, *args, **options):
+        rebuild_catalog()
+        self.stdout.write("Tag catalog rebuilt")
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 11:43
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def populate_tag_catalog(apps, schema_editor):
+    Tag = apps.get_model('forum', 'Tag')
+    Post = apps.get_model('forum', 'Post')
+    for tag in Tag.objects.all():
+        posts = Post.objects.filter(published=True, tags=tag)
+        tag.post_count = posts.count()
+        tag.last_post = posts.aggregate(last=Max('created'))['last']
+        tag.save(update_fields=['post_count', 'last_post'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0002_auto_20160306_0934'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='last_post',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_tag_catalog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 11:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0003_tag_catalog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedThread',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('created', models.DateTimeField()),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+                ('document', models.TextField()),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='comment',
+            index_together=set([('post', 'created')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='post',
+            index_together=set([('published', 'created')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 11:59
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0004_archived_thread'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appuser',
+            name='banned',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='comment',
+            index_together=set([('post', 'created'), ('published', 'created')]),
+        ),
+    ]
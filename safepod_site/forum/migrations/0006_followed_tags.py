@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-19 12:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0005_moderation_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appuser',
+            name='followed_tags',
+            field=models.ManyToManyField(blank=True, related_name='followers', to='forum.Tag'),
+        ),
+    ]
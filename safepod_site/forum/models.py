@@ -12,6 +12,10 @@ class Tag(models.Model):
     description = models.CharField(max_length=300, blank=True)
     slug = models.SlugField(max_length=50, unique=True)
     
+    # Denormalised catalog columns, maintained incrementally by forum.signals
+    post_count = models.IntegerField(default=0, editable=False)
+    last_post = models.DateTimeField(null=True, blank=True, editable=False)
+    
     # Order based on name
     class Meta:
         ordering = ["name"]
@@ -27,7 +31,9 @@ class AppUser(models.Model):
     
     id = models.CharField(max_length=50, primary_key=True)
     # If the user is banned for spamming
-    banned = models.BooleanField(default=False)
+    banned = models.BooleanField(default=False, db_index=True)
+    # Tags whose posts make up the user's feed, see forum.feed
+    followed_tags = models.ManyToManyField(Tag, blank=True, related_name="followers")
     
     def __unicode__(self):
         return self.id
@@ -61,6 +67,8 @@ class Post(models.Model):
     # Helper functions
     class Meta:
         ordering = ["-created"]
+        # Every listing filters on published and sorts on created
+        index_together = [["published", "created"]]
 
     def get_absolute_url(self):
         return reverse('forum:post',args=[str(self.slug)])
@@ -97,9 +105,28 @@ class Comment(models.Model):
     # Helper functions
     class Meta:
         ordering = ["-created"]
+        # Comments are read per post, newest first, and moderated by published state
+        index_together = [["post", "created"], ["published", "created"]]
 
     def get_absolute_url(self):
         return reverse('forum:comment',args=[str(self.slug)])
     
     def __unicode__(self):
-        return self.body[:25]
\ No newline at end of file
+        return self.body[:25]
+    
+# Model for a thread (a post with its comments and votes) moved to cold storage by the archive_threads command
+class ArchivedThread(models.Model):
+    
+    # Same id as the post it was archived from, so it stays reachable through the post detail url
+    id = models.IntegerField(primary_key=True)
+    created = models.DateTimeField()
+    archived = models.DateTimeField(auto_now_add=True)
+    
+    # JSON document of the thread, see forum.archive
+    document = models.TextField()
+    
+    class Meta:
+        ordering = ["-created"]
+    
+    def __unicode__(self):
+        return unicode(self.id)
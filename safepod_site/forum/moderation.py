@@ -0,0 +1,46 @@
+"""
+Set-based moderation used by the admin actions.
+
+Every action is a handful of UPDATE statements however many rows it hits.
+QuerySet.update() sends no signals, so the tag catalog is recounted for the
+affected tags, and their feed indexes and the hot post cache are dropped,
+here instead.
+"""
+from django.db import transaction
+
+from .catalog import recount_tags, tag_catalog
+from .feed import evict_tags
+from .hotcache import post_details
+from .models import AppUser, Comment, Post
+
+
+def content_changed(post_ids):
+    tag_ids = list(Post.tags.through.objects.filter(post_id__in=post_ids)
+                                            .values_list('tag_id', flat=True).distinct())
+    recount_tags(tag_ids)
+    tag_catalog.expire()
+    evict_tags(tag_ids)
+    transaction.on_commit(post_details.clear)
+
+
+def unpublish_posts(post_ids):
+    with transaction.atomic():
+        count = Post.objects.filter(id__in=post_ids, published=True).update(published=False)
+        content_changed(post_ids)
+    return count
+
+
+def unpublish_comments(comment_ids):
+    count = Comment.objects.filter(id__in=comment_ids, published=True).update(published=False)
+    transaction.on_commit(post_details.clear)
+    return count
+
+
+def ban_users(user_ids):
+    """Ban the users and hide everything they posted, returns the number of users banned"""
+    with transaction.atomic():
+        count = AppUser.objects.filter(id__in=user_ids).update(banned=True)
+        Post.objects.filter(app_user_id__in=user_ids, published=True).update(published=False)
+        Comment.objects.filter(app_user_id__in=user_ids, published=True).update(published=False)
+        content_changed(Post.objects.filter(app_user_id__in=user_ids).values_list('id', flat=True))
+    return count
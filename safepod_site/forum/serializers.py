@@ -0,0 +1,208 @@
+"""
+Serializers for the forum API.
+
+Views build plain, typed records with the functions below (ints stay ints,
+datetimes stay datetimes) and hand them to render(), which picks the encoding
+from the request's Accept header: the supported type with the highest
+q-value wins, the first one listed among equals, and types with q=0 are
+never used:
+
+- application/json, the default, keeps the format the app has always
+  received: ids and counters as strings and one object per record.
+- application/msgpack (or application/x-msgpack) and application/cbor are
+  compact binary encodings for slow links. Numbers keep their type,
+  datetimes become epoch milliseconds and record lists are sent column by
+  column, e.g. {'id': [1, 2], 'body': ['..', '..']}, so keys are not
+  repeated per comment or post.
+
+The binary encodings need the optional msgpack and cbor2 packages, without
+them every request gets JSON.
+"""
+import calendar
+import datetime
+
+from django.http.response import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.html import escape
+
+from .votes import user_votes
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+CBOR = 'application/cbor'
+
+# Fields the JSON format has always sent as strings
+STRING_FIELDS = ('id', 'likes', 'dislikes')
+
+POST_SUMMARY_FIELDS = ('body', 'id', 'tags')
+VOTABLE_FIELDS = ('body', 'id', 'created', 'likes', 'dislikes', 'posted', 'liked', 'disliked')
+TAG_FIELDS = ('tag', 'slug', 'description', 'posts', 'last_post')
+
+
+class Records(list):
+    """A list of records sharing the given fields, sent as columns by the binary encodings"""
+
+    def __init__(self, fields, rows=()):
+        super(Records, self).__init__(rows)
+        self.fields = fields
+
+
+# Records
+
+def post_summary(item):
+    return {'body': escape(item.body)[:100],
+            'id': item.pk,
+            'tags': [tag.name for tag in item.tags.all()],
+            }
+
+
+# With a user, every summary also tells whether they liked or disliked the post
+def post_summaries(queryset, userid=''):
+    if not userid:
+        return Records(POST_SUMMARY_FIELDS, [post_summary(item) for item in queryset])
+
+    state = user_votes(userid)
+    results = Records(POST_SUMMARY_FIELDS + ('liked', 'disliked'))
+    for item in queryset:
+        result = post_summary(item)
+        result['liked'] = item.pk in state.liked_posts
+        result['disliked'] = item.pk in state.disliked_posts
+        results.append(result)
+    return results
+
+
+# Post or comment without anything user specific, app_user is kept for the overlay
+def votable_base(obj):
+    return {'body': obj.body,
+            'id': obj.pk,
+            'created': obj.created,
+            'likes': obj.likes,
+            'dislikes': obj.dislikes,
+            'app_user': obj.app_user_id,
+            }
+
+
+# Adds the vote state of the given user to a votable base record
+def overlay(base, userid, liked, disliked):
+    result = dict(base)
+    result['posted'] = result.pop('app_user') == userid
+    result['liked'] = base['id'] in liked
+    result['disliked'] = base['id'] in disliked
+    return result
+
+
+def comment_detail(commentobj, userid):
+    state = user_votes(userid)
+    return overlay(votable_base(commentobj), userid, state.liked_comments, state.disliked_comments)
+
+
+# Post with its tags and comments, the same for every user and so safe to cache (see forum.hotcache)
+def post_detail_base(postobj):
+    result = votable_base(postobj)
+    result['tags'] = [tag.name for tag in postobj.tags.all()]
+    result['comments'] = Records(VOTABLE_FIELDS, [votable_base(item) for item in postobj.comment_set.all()])
+    return result
+
+
+def post_detail_overlay(base, userid):
+    state = user_votes(userid)
+    result = overlay(base, userid, state.liked_posts, state.disliked_posts)
+    result['comments'] = Records(VOTABLE_FIELDS, [overlay(item, userid, state.liked_comments, state.disliked_comments)
+                                                  for item in base['comments']])
+    return result
+
+
+def post_detail(postobj, userid):
+    return post_detail_overlay(post_detail_base(postobj), userid)
+
+
+# Encoding
+
+def accepted_types(request):
+    """Media types of the Accept header, most preferred first, leaving out those with q=0"""
+    accepted = []
+    for position, item in enumerate(request.META.get('HTTP_ACCEPT', '').split(',')):
+        params = item.split(';')
+        quality = 1.0
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            # Equally preferred types keep the order they are listed in
+            accepted.append((-quality, position, params[0].strip().lower()))
+    return [media_type for quality, position, media_type in sorted(accepted)]
+
+
+def negotiate(request):
+    """Media type to answer the request with"""
+    for media_type in accepted_types(request):
+        if media_type in (JSON, 'application/*', '*/*'):
+            return JSON
+        if media_type in (MSGPACK, 'application/x-msgpack') and msgpack is not None:
+            return MSGPACK
+        if media_type == CBOR and cbor2 is not None:
+            return CBOR
+    return JSON
+
+
+def epoch_millis(value):
+    return calendar.timegm(value.utctimetuple()) * 1000 + value.microsecond // 1000
+
+
+def as_json(value, nested=False):
+    """Legacy JSON shape: counters and ids as strings"""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            # Records nested in another payload (comments of a post) have always sent created via str()
+            if key in STRING_FIELDS or (nested and key == 'created'):
+                result[key] = str(item)
+            else:
+                result[key] = as_json(item, nested)
+        return result
+    if isinstance(value, Records):
+        return [as_json(item, nested=True) for item in value]
+    return value
+
+
+def as_compact(value):
+    """Binary shape: record lists as columns, datetimes as epoch milliseconds"""
+    if isinstance(value, Records):
+        return dict((field, [as_compact(item[field]) for item in value]) for field in value.fields)
+    if isinstance(value, dict):
+        return dict((key, as_compact(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [as_compact(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return epoch_millis(value)
+    return value
+
+
+def render(request, payload, status=200):
+    """Encode the payload in the format negotiated with the client"""
+    media_type = negotiate(request)
+    if media_type == JSON:
+        response = JsonResponse(as_json(payload), status=status)
+    else:
+        data = as_compact(payload)
+        if media_type == MSGPACK:
+            body = msgpack.packb(data, use_bin_type=True)
+        else:
+            body = cbor2.dumps(data)
+        response = HttpResponse(body, content_type=media_type, status=status)
+    patch_vary_headers(response, ('Accept',))
+    return response
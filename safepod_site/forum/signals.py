@@ -0,0 +1,179 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+
+from .models import AppUser, Comment, Post, Tag
+from .catalog import add_post_to_tags, recount_tags, tag_catalog
+from .feed import evict_tags, forget_feed
+from .hotcache import evict_post, post_details
+from .votes import LINKS, forget_votes, update_votes
+
+
+def after_commit(func, *args):
+    """Call func(*args) once the current transaction is committed, at once outside of one"""
+    transaction.on_commit(lambda: func(*args))
+
+
+# Remember the published flag as loaded so that a save can tell an (un)publish apart from an edit
+def remember_published(sender, instance, **kwargs):
+    instance._published_was = instance.published
+
+
+# Publishing or unpublishing a post moves it in or out of all its tags
+def post_saved(sender, instance, created, **kwargs):
+    if not created and instance.published != instance._published_was:
+        tag_ids = list(instance.tags.values_list('id', flat=True))
+        if instance.published:
+            add_post_to_tags(instance, tag_ids)
+        else:
+            recount_tags(tag_ids)
+        tag_catalog.expire()
+        evict_tags(tag_ids)
+    instance._published_was = instance.published
+
+
+# Set while a bulk delete keeps the tag catalog up to date itself, see forum.archive
+_bulk = threading.local()
+
+
+@contextmanager
+def tags_recounted_in_bulk():
+    """Skip the per-post tag bookkeeping of deletes, the caller recounts the tags once"""
+    _bulk.active = True
+    try:
+        yield
+    finally:
+        _bulk.active = False
+
+
+# The tag links of a deleted post vanish without m2m signals, so collect them beforehand
+def post_deleting(sender, instance, **kwargs):
+    if getattr(_bulk, 'active', False):
+        return
+    instance._deleted_tag_ids = list(instance.tags.values_list('id', flat=True))
+
+
+def post_deleted(sender, instance, **kwargs):
+    if getattr(_bulk, 'active', False):
+        return
+    if instance.published:
+        recount_tags(instance._deleted_tag_ids)
+        tag_catalog.expire()
+        evict_tags(instance._deleted_tag_ids)
+
+
+def post_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # tag.post_set.add(...) and friends only ever touch the one tag
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            recount_tags([instance.pk])
+            tag_catalog.expire()
+            evict_tags([instance.pk])
+        return
+
+    if action == 'pre_clear':
+        instance._cleared_tag_ids = list(instance.tags.values_list('id', flat=True))
+    elif instance.published:
+        if action == 'post_add':
+            add_post_to_tags(instance, pk_set)
+            tag_ids = pk_set
+        elif action == 'post_remove':
+            recount_tags(pk_set)
+            tag_ids = pk_set
+        elif action == 'post_clear':
+            recount_tags(instance._cleared_tag_ids)
+            tag_ids = instance._cleared_tag_ids
+        else:
+            return
+        tag_catalog.expire()
+        evict_tags(tag_ids)
+
+
+# Hot post cache invalidation, see forum.hotcache. Deferred to the commit, or
+# another thread could cache the thread again as it was before the change.
+
+def post_changed(sender, instance, **kwargs):
+    after_commit(evict_post, instance.pk)
+
+
+def comment_changed(sender, instance, **kwargs):
+    after_commit(evict_post, instance.post_id)
+
+
+# Tag links and votes (the counters move with them) on a post or a comment
+def links_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Changed from the tag or user side, the affected posts are not at hand
+        after_commit(post_details.clear)
+    elif isinstance(instance, Comment):
+        after_commit(evict_post, instance.post_id)
+    else:
+        after_commit(evict_post, instance.pk)
+
+
+# Tag names are part of every cached post
+def tag_changed(sender, instance, **kwargs):
+    after_commit(post_details.clear)
+
+
+# Keep the cached vote index of every affected user in step, see forum.votes.
+# Only once the change is committed: before, another request could still
+# rebuild the index from the rows as they were.
+VOTE_KINDS = dict((through, (kind, field)) for kind, (through, field) in LINKS.items())
+
+
+def votes_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    kind, field = VOTE_KINDS[sender]
+    if reverse:
+        # Changed from the user side, pk_set holds posts or comments
+        if action in ('post_add', 'post_remove'):
+            after_commit(update_votes, instance.pk, kind, list(pk_set), action == 'post_add')
+        elif action == 'post_clear':
+            after_commit(forget_votes, instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        for userid in pk_set:
+            after_commit(update_votes, userid, kind, [instance.pk], action == 'post_add')
+    elif action == 'pre_clear':
+        # The voters are gone once the links are cleared
+        instance._cleared_voters = list(sender.objects.filter(**{field: instance.pk}).values_list('appuser_id', flat=True))
+    elif action == 'post_clear':
+        for userid in instance._cleared_voters:
+            after_commit(forget_votes, userid)
+
+
+# A user's cached feed is rebuilt after they follow or unfollow a tag, see forum.feed
+def follows_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        forget_feed(instance.pk)
+    elif pk_set:
+        # Changed from the tag side, the users are known except for a clear
+        for userid in pk_set:
+            forget_feed(userid)
+
+
+def connect():
+    post_init.connect(remember_published, sender=Post)
+    post_save.connect(post_saved, sender=Post)
+    pre_delete.connect(post_deleting, sender=Post)
+    post_delete.connect(post_deleted, sender=Post)
+    m2m_changed.connect(post_tags_changed, sender=Post.tags.through)
+
+    post_save.connect(post_changed, sender=Post)
+    post_delete.connect(post_changed, sender=Post)
+    post_save.connect(comment_changed, sender=Comment)
+    post_delete.connect(comment_changed, sender=Comment)
+    post_save.connect(tag_changed, sender=Tag)
+    post_delete.connect(tag_changed, sender=Tag)
+    for through in (Post.tags.through, Post.liked.through, Post.disliked.through,
+                    Comment.liked.through, Comment.disliked.through):
+        m2m_changed.connect(links_changed, sender=through)
+    for through in VOTE_KINDS:
+        m2m_changed.connect(votes_changed, sender=through)
+
+    m2m_changed.connect(follows_changed, sender=AppUser.followed_tags.through)
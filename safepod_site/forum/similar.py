@@ -0,0 +1,267 @@
+"""
+Similar posts index.
+
+``build_index`` turns the published posts into sparse tf-idf vectors and
+stores, for every post, the ids and cosine scores of its nearest neighbours
+as plain ``.npy`` arrays in ``FORUM_SIMILAR_DIR``. The raw term counts are
+kept next to them, so a rebuild only tokenizes posts published since the last
+one and drops the rows of posts that went away; the weights and neighbours
+are then recomputed from the counts, which is cheap compared to reading every
+post body again.
+
+Workers never compute anything: ``similar_index`` memory-maps the neighbour
+arrays and answers a lookup with a binary search on the sorted post ids.
+NumPy and SciPy are optional, without them (or before the first build) there
+are simply no similar posts. They are only imported once an index is built or
+mapped, so starting a worker never pays for them.
+"""
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Post
+from .text import tokenize
+
+
+# Files of the index, the manifest is written last and marks a complete build
+COUNTS = 'counts.npz'
+VOCABULARY = 'vocabulary.json'
+IDS = 'ids.npy'
+NEIGHBOURS = 'neighbours.npy'
+SCORES = 'scores.npy'
+MANIFEST = 'manifest.json'
+
+# Most similarity scores held in memory at once while looking for neighbours
+BLOCK_CELLS = 4 * 1024 * 1024
+
+
+# Building
+
+def available():
+    """Whether NumPy and SciPy, needed to build the index, are installed"""
+    try:
+        import numpy
+        import scipy.sparse
+    except ImportError:
+        return False
+    return True
+
+
+def load_counts(directory):
+    """Return the post ids, vocabulary and term counts of the last build, or None"""
+    import numpy as np
+    from scipy import sparse
+    try:
+        with open(os.path.join(directory, VOCABULARY)) as f:
+            vocabulary = json.load(f)
+        ids = np.load(os.path.join(directory, IDS))
+        counts = sparse.load_npz(os.path.join(directory, COUNTS)).tocsr()
+    except (IOError, ValueError):
+        return None
+    if counts.shape != (len(ids), len(vocabulary)):
+        return None
+    return ids, vocabulary, counts
+
+
+def count_terms(rows, vocabulary):
+    """
+    Term counts of the given (id, body) rows as CSR arrays (data, indices, indptr).
+    Words not seen before are appended to the vocabulary, a dict of word to column.
+    """
+    data, indices, indptr = [], [], [0]
+    for _, body in rows:
+        counts = {}
+        for word in tokenize(body):
+            column = vocabulary.setdefault(word, len(vocabulary))
+            counts[column] = counts.get(column, 0) + 1
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+    return data, indices, indptr
+
+
+def weigh(counts):
+    """L2 normalised tf-idf rows, with a logarithmic term frequency"""
+    import numpy as np
+    from scipy import sparse
+    documents = counts.shape[0]
+    if not documents:
+        return counts.astype(np.float32)
+    frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = np.log((1.0 + documents) / (1.0 + frequency)) + 1.0
+    weights = counts.astype(np.float32)
+    weights.data = (1.0 + np.log(weights.data)) * idf[weights.indices]
+    norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms).dot(weights), dtype=np.float32)
+
+
+def nearest(weights, k):
+    """Row numbers and cosine scores of the k most similar other rows, -1 where there are none"""
+    import numpy as np
+    n = weights.shape[0]
+    k = max(0, min(k, n - 1))
+    neighbours = np.full((n, k), -1, dtype=np.int64)
+    scores = np.zeros((n, k), dtype=np.float32)
+    if not k:
+        return neighbours, scores
+
+    # Similarities are computed a block of rows at a time, against the whole corpus
+    transposed = weights.T.tocsc()
+    step = max(1, BLOCK_CELLS // n)
+    for start in range(0, n, step):
+        stop = min(n, start + step)
+        block = weights[start:stop].dot(transposed).toarray()
+        rows = np.arange(stop - start)
+        # A post is not its own neighbour
+        block[rows, rows + start] = -1
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = block[rows[:, None], top]
+        order = np.argsort(-top_scores, axis=1)
+        neighbours[start:stop] = top[rows[:, None], order]
+        scores[start:stop] = top_scores[rows[:, None], order]
+
+    neighbours[scores <= 0] = -1
+    scores[scores <= 0] = 0
+    return neighbours, scores
+
+
+def _write(directory, name, save):
+    """Write one file of the index under a temporary name and move it into place"""
+    path = os.path.join(directory, name)
+    with open(path + '.tmp', 'wb') as f:
+        save(f)
+    os.rename(path + '.tmp', path)
+
+
+def build_index(directory, k, full=False, batch_size=1000):
+    """
+    Bring the index in the directory up to date with the published posts.
+    Returns the number of posts indexed, added and removed.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    live = np.array(sorted(Post.objects.filter(published=True).values_list('id', flat=True)), dtype=np.int64)
+
+    stored = None if full else load_counts(directory)
+    if stored is None:
+        ids, vocabulary, counts = np.zeros(0, dtype=np.int64), {}, None
+    else:
+        ids, words, counts = stored
+        vocabulary = dict((word, column) for column, word in enumerate(words))
+        keep = np.in1d(ids, live)
+        ids, counts = ids[keep], counts[keep]
+    removed = 0 if stored is None else len(stored[0]) - len(ids)
+
+    # Only posts that are not in the index yet are read and tokenized
+    added = np.setdiff1d(live, ids)
+    data, indices, indptr = [], [], [0]
+    for start in range(0, len(added), batch_size):
+        batch = [int(pk) for pk in added[start:start + batch_size]]
+        rows = Post.objects.filter(id__in=batch).order_by('id').values_list('id', 'body')
+        batch_data, batch_indices, batch_indptr = count_terms(rows, vocabulary)
+        data.extend(batch_data)
+        indices.extend(batch_indices)
+        offset = indptr[-1]
+        indptr.extend(pointer + offset for pointer in batch_indptr[1:])
+
+    shape = (len(added), len(vocabulary))
+    new_counts = sparse.csr_matrix((np.array(data, dtype=np.float32), np.array(indices, dtype=np.int32),
+                                    np.array(indptr, dtype=np.int64)), shape=shape)
+    if counts is not None:
+        # Columns of words first seen in this build are empty for the older rows
+        counts = sparse.csr_matrix((counts.data, counts.indices, counts.indptr),
+                                   shape=(counts.shape[0], len(vocabulary)))
+        new_counts = sparse.vstack([counts, new_counts], format='csr')
+
+    ids = np.concatenate([ids, added])
+    order = np.argsort(ids, kind='mergesort')
+    ids, counts = ids[order], new_counts[order]
+
+    neighbours, scores = nearest(weigh(counts), k)
+    neighbour_ids = np.where(neighbours >= 0, ids[np.maximum(neighbours, 0)], -1)
+
+    words = sorted(vocabulary, key=vocabulary.get)
+    _write(directory, COUNTS, lambda f: sparse.save_npz(f, counts))
+    _write(directory, VOCABULARY, lambda f: f.write(json.dumps(words).encode('utf-8')))
+    _write(directory, IDS, lambda f: np.save(f, ids))
+    _write(directory, NEIGHBOURS, lambda f: np.save(f, neighbour_ids))
+    _write(directory, SCORES, lambda f: np.save(f, scores))
+    _write(directory, MANIFEST, lambda f: f.write(json.dumps({'posts': len(ids),
+                                                              'terms': len(words),
+                                                              'neighbours': neighbours.shape[1],
+                                                              'built': time.time()}).encode('utf-8')))
+    return len(ids), len(added), removed
+
+
+# Serving
+
+class SimilarIndex(object):
+    """
+    Memory-mapped view of the neighbour arrays written by build_index.
+
+    The manifest is looked at no more than once every ``check_interval``
+    seconds, and the arrays are mapped again when a newer build replaced it.
+    """
+
+    def __init__(self, directory, check_interval):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._arrays = None
+        self._stamp = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Map the arrays of the current build, None if there is no complete one (or no NumPy)"""
+        try:
+            import numpy as np
+        except ImportError:
+            return None
+        try:
+            ids = np.load(os.path.join(self.directory, IDS), mmap_mode='r')
+            neighbours = np.load(os.path.join(self.directory, NEIGHBOURS), mmap_mode='r')
+            scores = np.load(os.path.join(self.directory, SCORES), mmap_mode='r')
+        except (IOError, ValueError):
+            return None
+        # A build may be moving its files into place right now
+        if not len(ids) == len(neighbours) == len(scores):
+            return None
+        return ids, neighbours, scores
+
+    def arrays(self):
+        now = time.time()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                self._checked_at = now
+                try:
+                    stamp = os.path.getmtime(os.path.join(self.directory, MANIFEST))
+                except OSError:
+                    stamp = None
+                if stamp != self._stamp:
+                    arrays = self.open() if stamp is not None else None
+                    if arrays is not None or stamp is None:
+                        self._arrays, self._stamp = arrays, stamp
+        return self._arrays
+
+    def similar(self, post_id):
+        """Ids and scores of the posts most similar to the given one, best first"""
+        arrays = self.arrays()
+        if arrays is None:
+            return []
+        ids, neighbours, scores = arrays
+        row = ids.searchsorted(int(post_id))
+        if row == len(ids) or ids[row] != int(post_id):
+            return []
+        return [(int(pk), float(score)) for pk, score in zip(neighbours[row], scores[row]) if pk >= 0]
+
+
+similar_index = SimilarIndex(getattr(settings, 'FORUM_SIMILAR_DIR', os.path.join(settings.BASE_DIR, 'similar_index')),
+                             getattr(settings, 'FORUM_SIMILAR_CHECK_INTERVAL', 60))
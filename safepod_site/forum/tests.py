@@ -1,3 +1,638 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from unittest import skipIf
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.db.models import Count, Max
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from safepod_site.querybudget import budget_for, query_budget
+from safepod_site.settings import secrets
+from safepod_site.settings.secrets import get_secret_key
+
+from . import serializers, urls
+from .catalog import tag_catalog
+from .hotcache import get_post_detail, post_details
+from .archive import archive_inactive, archive_posts
+from .feed import cache as feed_cache, tag_indexes, tag_key, user_key
+from .models import AppUser, ArchivedThread, Comment, Post, Tag
+from .similar import available as similar_available, build_index, similar_index
+from .moderation import ban_users, unpublish_comments, unpublish_posts
+from .transfer import MODELS, export_records, import_records
+from .votes import VoteState, cache_key, generation_key, next_generation, user_votes
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Every forum route stays within its query budget in QUERY_BUDGETS, with
+    the shared and per-worker caches cold but the tag catalog loaded, as it
+    is in a worker that has started up. Seconds are not checked here, they
+    depend on the machine running the tests.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [AppUser.objects.create(id='user-%d' % i) for i in range(3)]
+        cls.tags = [Tag.objects.create(name='Tag %d' % i, slug='tag-%d' % i) for i in range(3)]
+        cls.posts = []
+        for i in range(12):
+            post = Post.objects.create(body='Post number %d about sleep and stress' % i, app_user=cls.users[i % 3])
+            post.tags.add(*cls.tags[:1 + i % 3])
+            post.liked.add(cls.users[(i + 1) % 3])
+            for j in range(3):
+                comment = Comment.objects.create(body='Comment %d' % j, app_user=cls.users[j], post=post)
+                comment.disliked.add(cls.users[(j + 1) % 3])
+            cls.posts.append(post)
+        cls.users[0].followed_tags.add(*cls.tags[1:])
+
+    def setUp(self):
+        caches['default'].clear()
+        post_details.clear()
+        # The catalog is served from the worker's snapshot, see forum.catalog
+        tag_catalog.refresh()
+
+    def within_budget(self, name, request):
+        queries = budget_for(name)[0]
+        with query_budget(queries, fail=True, label=name):
+            response = request()
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def get(self, name, params=None, **kwargs):
+        params = dict(params or {}, sign=get_secret_key("APP_ID"))
+        return self.within_budget(name, lambda: self.client.get(reverse(name, kwargs=kwargs), params))
+
+    def post(self, name, body, **kwargs):
+        body = json.dumps(dict(body, sign=get_secret_key("APP_ID")))
+        return self.within_budget(name, lambda: self.client.post(reverse(name, kwargs=kwargs), body,
+                                                                 content_type='application/json'))
+
+    def test_every_route_is_tested(self):
+        for pattern in urls.urlpatterns:
+            self.assertTrue(hasattr(self, 'test_%s' % pattern.name), "No budget test for %s" % pattern.name)
+
+    def test_posts_index(self):
+        self.assertEqual(len(self.get('posts_index', {'userid': 'user-0'})['results']), 10)
+
+    def test_search(self):
+        self.assertEqual(len(self.get('search', {'q': 'sleep stress', 'userid': 'user-0'})['results']), 10)
+
+    def test_all_tags(self):
+        self.assertEqual(len(self.get('all_tags')['results']), 3)
+
+    def test_tagged_posts(self):
+        self.assertEqual(len(self.get('tagged_posts', {'userid': 'user-1'}, slug='tag-0')['results']), 12)
+
+    def test_my_post(self):
+        self.assertEqual(len(self.get('my_post', {'userid': 'user-1'})['results']), 4)
+
+    def test_feed(self):
+        self.assertEqual(len(self.get('feed', {'userid': 'user-0'})['results']), 8)
+
+    def test_similar_posts(self):
+        self.get('similar_posts', {'userid': 'user-0'}, pk=self.posts[0].pk)
+
+    def test_post_detail(self):
+        results = self.get('post_detail', {'userid': 'user-0'}, pk=self.posts[0].pk)['results']
+        self.assertEqual(len(results['comments']), 3)
+
+    def test_post_detail_vote(self):
+        self.assertTrue(self.post('post_detail', {'userid': 'user-2', 'liked': True}, pk=self.posts[0].pk)['success'])
+
+    def test_comment_detail(self):
+        self.get('comment_detail', {'userid': 'user-0'}, pk=Comment.objects.order_by('id')[0].pk)
+
+    def test_comment_detail_vote(self):
+        self.assertTrue(self.post('comment_detail', {'userid': 'user-2', 'liked': True},
+                                  pk=Comment.objects.order_by('id')[0].pk)['success'])
+
+    def test_new_post(self):
+        self.assertTrue(self.post('new_post', {'userid': 'user-9', 'body': 'New post', 'tags': ['tag-0', 'tag-1']})['success'])
+
+    def test_new_comment(self):
+        self.assertTrue(self.post('new_comment', {'userid': 'user-9', 'body': 'New comment', 'post': self.posts[0].pk})['success'])
+
+    def test_follow_tag(self):
+        self.assertTrue(self.post('follow_tag', {'userid': 'user-2'}, slug='tag-2')['success'])
+
+    def test_unsigned_reads_query_nothing(self):
+        for name, kwargs in (('feed', {}), ('similar_posts', {'pk': 1}), ('post_detail', {'pk': 1})):
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(reverse(name, kwargs=kwargs), {'userid': 'user-0'}).status_code, 400)
+
+    def test_over_budget_reports_repeated_statements(self):
+        budget = query_budget(2, fail=True, label='loop')
+        with self.assertRaises(AssertionError) as raised:
+            with budget:
+                for post in Post.objects.all()[:4]:
+                    list(post.tags.all())
+        self.assertEqual(len(budget.queries), 5)
+        self.assertIn('4x SELECT', str(raised.exception))
+        self.assertIn('forum/tests.py', str(raised.exception))
+
+
+class PostEndpointTests(TransactionTestCase):
+    """
+    The POST endpoints of the app, which is signed but sends no CSRF token.
+    Transactional, the caches only follow changes once they are committed.
+    """
+
+    def setUp(self):
+        post_details.clear()
+        self.client = Client(enforce_csrf_checks=True)
+        self.user = AppUser.objects.create(id='user-0')
+        self.tag = Tag.objects.create(name='Tag', slug='tag')
+        self.post = Post.objects.create(body='Post', app_user=self.user)
+        self.comment = Comment.objects.create(body='Comment', app_user=self.user, post=self.post)
+
+    def send(self, name, body, **kwargs):
+        response = self.client.post(reverse(name, kwargs=kwargs), json.dumps(dict(body, sign=get_secret_key("APP_ID"))),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['success']
+
+    def counts(self, obj):
+        obj = type(obj)._default_manager.filter().get(pk=obj.pk)
+        return (obj.likes, obj.dislikes, obj.liked.count(), obj.disliked.count())
+
+    def test_unsigned_post_is_rejected(self):
+        response = self.client.post(reverse('new_post'), json.dumps({'userid': 'user-0', 'body': 'Post', 'tags': []}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_post(self):
+        self.assertTrue(self.send('new_post', {'userid': 'user-1', 'body': 'New post', 'tags': ['tag']}))
+        self.assertEqual(list(Post.objects.get(body='New post').tags.all()), [self.tag])
+
+    def test_new_comment(self):
+        self.assertTrue(self.send('new_comment', {'userid': 'user-1', 'body': 'New comment', 'post': self.post.pk}))
+        self.assertEqual(Comment.objects.get(body='New comment').post, self.post)
+
+    def test_follow_tag(self):
+        self.assertTrue(self.send('follow_tag', {'userid': 'user-0'}, slug='tag'))
+        self.assertEqual(list(self.user.followed_tags.all()), [self.tag])
+
+    def test_post_votes(self):
+        self.assertTrue(self.send('post_detail', {'userid': 'user-0', 'liked': True}, pk=self.post.pk))
+        self.assertTrue(self.send('post_detail', {'userid': 'user-0', 'liked': True}, pk=self.post.pk))
+        self.assertEqual(self.counts(self.post), (1, 0, 1, 0))
+        self.assertTrue(self.send('post_detail', {'userid': 'user-0', 'disliked': True}, pk=self.post.pk))
+        self.assertEqual(self.counts(self.post), (0, 1, 0, 1))
+        self.assertTrue(self.send('post_detail', {'userid': 'user-0', 'disliked': False}, pk=self.post.pk))
+        self.assertEqual(self.counts(self.post), (0, 0, 0, 0))
+
+    def test_comment_votes(self):
+        self.assertTrue(self.send('comment_detail', {'userid': 'user-0', 'disliked': True}, pk=self.comment.pk))
+        self.assertTrue(self.send('comment_detail', {'userid': 'user-0', 'liked': True}, pk=self.comment.pk))
+        self.assertEqual(self.counts(self.comment), (1, 0, 1, 0))
+        self.assertTrue(self.send('comment_detail', {'userid': 'user-0', 'liked': False}, pk=self.comment.pk))
+        self.assertEqual(self.counts(self.comment), (0, 0, 0, 0))
+
+    def test_vote_is_served_with_the_post(self):
+        detail = self.client.get(reverse('post_detail', kwargs={'pk': self.post.pk}),
+                                 {'sign': get_secret_key("APP_ID"), 'userid': 'user-0'})
+        self.assertEqual(detail.status_code, 200)
+        self.send('post_detail', {'userid': 'user-0', 'liked': True}, pk=self.post.pk)
+        results = json.loads(self.client.get(reverse('post_detail', kwargs={'pk': self.post.pk}),
+                                             {'sign': get_secret_key("APP_ID"), 'userid': 'user-0'}).content)['results']
+        self.assertEqual((str(results['likes']), results['liked']), ('1', True))
+
+    def test_vote_of_unknown_user_fails(self):
+        self.assertFalse(self.send('post_detail', {'userid': 'user-9', 'liked': True}, pk=self.post.pk))
+        self.assertEqual(self.counts(self.post), (0, 0, 0, 0))
+
+
+class PostVisibilityTests(TransactionTestCase):
+    """
+    Unpublished posts are not served, whether hot, cached or archived.
+    Transactional, cached posts are only evicted once a change is committed.
+    """
+
+    def setUp(self):
+        post_details.clear()
+        self.user = AppUser.objects.create(id='user-0')
+        self.post = Post.objects.create(body='Hidden post', app_user=self.user)
+
+    def detail(self, pk):
+        return self.client.get(reverse('post_detail', kwargs={'pk': pk}), {'sign': get_secret_key("APP_ID")})
+
+    def test_unpublished_post_is_not_found(self):
+        Post.objects.filter(pk=self.post.pk).update(published=False)
+        self.assertEqual(self.detail(self.post.pk).status_code, 404)
+
+    def test_unpublishing_hides_a_cached_post(self):
+        self.assertEqual(self.detail(self.post.pk).status_code, 200)
+        self.post.published = False
+        self.post.save()
+        self.assertEqual(self.detail(self.post.pk).status_code, 404)
+
+    def test_cached_post_is_evicted_once_the_change_is_committed(self):
+        self.assertEqual(self.detail(self.post.pk).status_code, 200)
+        with transaction.atomic():
+            self.post.body = 'Edited post'
+            self.post.save()
+            # Until the commit other threads would only cache the old body again
+            self.assertIsNotNone(post_details.get(self.post.pk))
+        self.assertIsNone(post_details.get(self.post.pk))
+
+    def test_unpublished_archived_thread_is_not_found(self):
+        archive_posts([self.post.pk])
+        ArchivedThread.objects.filter(pk=self.post.pk).update(document=ArchivedThread.objects.get(pk=self.post.pk)
+                                                              .document.replace('"published": true', '"published": false'))
+        self.assertEqual(self.detail(self.post.pk).status_code, 404)
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.user = AppUser.objects.create(id='user-0')
+        self.tags = [Tag.objects.create(name='Tag %d' % i, slug='tag-%d' % i) for i in range(3)]
+        self.posts = []
+        for i in range(10):
+            post = Post.objects.create(body='Old post %d' % i, app_user=self.user)
+            post.tags.add(*self.tags)
+            self.posts.append(post)
+        Post.objects.filter(pk=self.posts[0].pk).update(published=False)
+
+    def test_only_published_threads_are_archived(self):
+        self.assertEqual(list(archive_inactive(timezone.now(), timezone.now())), [9])
+        self.assertEqual(ArchivedThread.objects.count(), 9)
+        self.assertTrue(Post.objects.filter(pk=self.posts[0].pk).exists())
+        self.assertEqual(list(Tag.objects.values_list('post_count', flat=True)), [0, 0, 0])
+
+    def test_tags_are_recounted_once_per_batch(self):
+        with query_budget() as small:
+            archive_posts([post.pk for post in self.posts[1:3]])
+        with query_budget() as large:
+            archive_posts([post.pk for post in self.posts[3:]])
+        # The cost of a batch does not grow with the number of posts in it
+        self.assertEqual(len(small.queries), len(large.queries))
+        self.assertEqual(list(Tag.objects.values_list('post_count', flat=True)), [0, 0, 0])
+
+
+@override_settings(FORUM_FEED_SIZE=5)
+class FeedTests(TestCase):
+    """A feed fills the places of posts that left it, and takes in posts tagged late"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.tag = Tag.objects.create(name='Tag', slug='tag')
+        self.follower = AppUser.objects.create(id='follower')
+        self.follower.followed_tags.add(self.tag)
+        self.older = self.create_posts(AppUser.objects.create(id='other'), 5, hours=2)
+        self.newer = self.create_posts(AppUser.objects.create(id='spam'), 5, hours=1)
+
+    def create_posts(self, user, count, hours, tagged=True):
+        posts = []
+        for i in range(count):
+            post = Post.objects.create(body='Post %d by %s' % (i, user.pk), app_user=user)
+            Post.objects.filter(pk=post.pk).update(created=timezone.now() - timezone.timedelta(hours=hours, minutes=i))
+            if tagged:
+                post.tags.add(self.tag)
+            posts.append(post)
+        return [post.pk for post in posts]
+
+    def feed(self):
+        response = self.client.get(reverse('feed'), {'sign': get_secret_key("APP_ID"), 'userid': 'follower'})
+        return [int(post['id']) for post in json.loads(response.content)['results']]
+
+    def age_feed(self, seconds):
+        key = user_key('follower')
+        feed = feed_cache().get(key)
+        feed['built'] -= seconds
+        feed['checked'] -= seconds
+        feed_cache().set(key, feed)
+
+    def test_banned_posts_are_replaced(self):
+        self.assertEqual(self.feed(), self.newer)
+        ban_users(['spam'])
+        self.assertEqual(self.feed(), self.older)
+
+    def test_unpublished_and_archived_posts_are_replaced(self):
+        self.assertEqual(self.feed(), self.newer)
+        post = Post.objects.get(pk=self.newer[0])
+        post.published = False
+        post.save()
+        archive_posts(self.newer[1:3])
+        self.assertEqual(self.feed(), self.newer[3:] + self.older[:3])
+
+    @override_settings(FORUM_FEED_REFRESH=30, FORUM_FEED_TTL=300)
+    def test_posts_tagged_late_show_up_once_the_feed_is_rebuilt(self):
+        # Posted between the two newest posts of the feed, tagged after the feed was built
+        late = self.create_posts(AppUser.objects.get(pk='other'), 1, hours=1, tagged=False)
+        Post.objects.filter(pk=late[0]).update(created=Post.objects.get(pk=self.newer[0]).created
+                                               - timezone.timedelta(seconds=30))
+        self.assertEqual(self.feed(), self.newer)
+        Post.objects.get(pk=late[0]).tags.add(self.tag)
+        # A refresh only merges in posts newer than the feed, and does not extend its lifetime
+        self.age_feed(60)
+        built = feed_cache().get(user_key('follower'))['built']
+        self.assertEqual(self.feed(), self.newer)
+        self.assertEqual(feed_cache().get(user_key('follower'))['built'], built)
+        self.age_feed(300)
+        self.assertEqual(self.feed(), self.newer[:1] + late + self.newer[1:4])
+
+
+def fresh_tag_counts():
+    """Published posts per tag slug, counted from scratch"""
+    counts = dict((slug, 0) for slug in Tag.objects.values_list('slug', flat=True))
+    counts.update(Tag.objects.filter(post__published=True).annotate(posts=Count('post')).values_list('slug', 'posts'))
+    return counts
+
+
+def tag_counts():
+    return dict(Tag.objects.values_list('slug', 'post_count'))
+
+
+class ModerationTests(TransactionTestCase):
+    """Transactional, the hot post cache is only cleared once the moderation is committed"""
+
+    def setUp(self):
+        caches['default'].clear()
+        post_details.clear()
+        self.tags = [Tag.objects.create(name='Tag %d' % i, slug='tag-%d' % i) for i in range(2)]
+        spam, other = AppUser.objects.create(id='spam'), AppUser.objects.create(id='other')
+        self.spam_posts, self.other_posts = [], []
+        for i in range(6):
+            post = Post.objects.create(body='Post %d' % i, app_user=spam if i < 4 else other)
+            post.tags.add(*self.tags[:1 + i % 2])
+            (self.spam_posts if i < 4 else self.other_posts).append(post.pk)
+            Comment.objects.create(body='Comment %d' % i, app_user=other if i < 4 else spam, post=post)
+        # Warm every cache the moderation has to clear
+        tag_catalog.refresh()
+        tag_indexes([tag.pk for tag in self.tags], 10)
+        for pk in self.spam_posts + self.other_posts:
+            get_post_detail(pk)
+
+    def assertCachesCleared(self):
+        self.assertEqual(len(post_details), 0)
+        self.assertEqual(feed_cache().get_many([tag_key(tag.pk) for tag in self.tags]), {})
+        # Expired, the next read revalidates it
+        self.assertEqual(tag_catalog._loaded_at, 0)
+
+    def test_unpublish_posts(self):
+        # A few statements plus three per affected tag, however many posts were selected
+        with self.assertNumQueries(9):
+            self.assertEqual(unpublish_posts(self.spam_posts[:3]), 3)
+        self.assertEqual(unpublish_posts(self.spam_posts[:3]), 0)
+        self.assertEqual(sorted(Post.objects.all().values_list('id', flat=True)), self.spam_posts[3:] + self.other_posts)
+        self.assertEqual(tag_counts(), fresh_tag_counts())
+        self.assertEqual(tag_counts(), {'tag-0': 3, 'tag-1': 2})
+        self.assertCachesCleared()
+
+    def test_unpublish_comments(self):
+        comment_ids = list(Comment.objects.filter(post_id__in=self.spam_posts[:2]).values_list('id', flat=True))
+        with self.assertNumQueries(2):
+            self.assertEqual(unpublish_comments(comment_ids), 2)
+        self.assertEqual(Comment.objects.all().count(), 4)
+        self.assertFalse(Comment.objects.all().filter(id__in=comment_ids).exists())
+        self.assertEqual(len(post_details), 0)
+
+    def test_ban_users(self):
+        with self.assertNumQueries(11):
+            self.assertEqual(ban_users(['spam']), 1)
+        self.assertTrue(AppUser.objects.get(pk='spam').banned)
+        self.assertFalse(AppUser.objects.get(pk='other').banned)
+        self.assertEqual(sorted(Post.objects.all().values_list('id', flat=True)), self.other_posts)
+        self.assertEqual(list(Comment.objects.all().values_list('post_id', flat=True).order_by('post_id')), self.spam_posts)
+        self.assertEqual(tag_counts(), fresh_tag_counts())
+        self.assertEqual(tag_counts(), {'tag-0': 2, 'tag-1': 1})
+        self.assertCachesCleared()
+
+
+class CatalogTests(TestCase):
+    """The incrementally kept tag totals match a count from scratch after every kind of change"""
+
+    def setUp(self):
+        self.user = AppUser.objects.create(id='user-0')
+        self.tags = [Tag.objects.create(name='Tag %d' % i, slug='tag-%d' % i) for i in range(3)]
+        self.posts = [Post.objects.create(body='Post %d' % i, app_user=self.user) for i in range(3)]
+        for i, post in enumerate(self.posts):
+            post.tags.add(*self.tags[i:])
+
+    def assertCatalogCounted(self):
+        tag_catalog.refresh()
+        snapshot = dict((item['slug'], (item['posts'], item['last_post'])) for item in tag_catalog.get())
+        fresh = {}
+        for tag in self.tags:
+            totals = Post.objects.filter(published=True, tags=tag).aggregate(posts=Count('id'), last=Max('created'))
+            fresh[tag.slug] = (totals['posts'], totals['last'])
+        self.assertEqual(snapshot, fresh)
+
+    def test_tags_added(self):
+        self.assertCatalogCounted()
+        post = Post.objects.create(body='New post', app_user=self.user)
+        post.tags.add(*self.tags[:2])
+        self.assertCatalogCounted()
+        # Added twice, counted once
+        post.tags.add(self.tags[0])
+        self.assertCatalogCounted()
+
+    def test_posts_added_from_the_tag_side(self):
+        self.tags[0].post_set.add(self.posts[1], self.posts[2])
+        self.assertCatalogCounted()
+
+    def test_tags_removed(self):
+        self.posts[2].tags.remove(self.tags[2])
+        self.assertCatalogCounted()
+        self.tags[1].post_set.remove(self.posts[0])
+        self.assertCatalogCounted()
+
+    def test_tags_cleared(self):
+        self.posts[0].tags.clear()
+        self.assertCatalogCounted()
+        self.tags[2].post_set.clear()
+        self.assertCatalogCounted()
+
+    def test_unpublish_and_republish(self):
+        post = self.posts[2]
+        post.published = False
+        post.save()
+        self.assertCatalogCounted()
+        # Tag links of an unpublished post do not count
+        post.tags.add(self.tags[0])
+        post.tags.remove(self.tags[2])
+        self.assertCatalogCounted()
+        post.published = True
+        post.save()
+        self.assertCatalogCounted()
+
+    def test_post_deleted(self):
+        self.posts[2].delete()
+        self.assertCatalogCounted()
+
+
+@skipIf(not similar_available(), "needs numpy and scipy")
+class SimilarPostsTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # Serve from the test's own index, looked at on every request
+        self.addCleanup(similar_index.__dict__.update, dict(similar_index.__dict__))
+        similar_index.directory, similar_index.check_interval = self.directory, 0
+        self.user = AppUser.objects.create(id='user-0')
+        bodies = ['anxiety at night keeps me awake', 'cannot sleep at night because of anxiety',
+                  'my dog ran away today', 'lost my dog in the park',
+                  'exam stress and anxiety before tests', 'nothing']
+        self.posts = [Post.objects.create(body=body, app_user=self.user).pk for body in bodies]
+
+    def build(self, **kwargs):
+        counts = build_index(self.directory, 2, batch_size=4, **kwargs)
+        # Mapped again on the next lookup, however coarse the file times
+        similar_index._stamp = None
+        return counts
+
+    def similar(self, pk):
+        response = self.client.get(reverse('similar_posts', kwargs={'pk': pk}), {'sign': get_secret_key("APP_ID")})
+        return [int(post['id']) for post in json.loads(response.content)['results']]
+
+    def neighbours(self):
+        return dict((pk, [neighbour for neighbour, score in similar_index.similar(pk)])
+                    for pk in Post.objects.all().values_list('id', flat=True))
+
+    def test_build_and_rebuild(self):
+        self.assertEqual(self.build(), (6, 6, 0))
+        self.assertEqual(self.similar(self.posts[2])[0], self.posts[3])
+        self.assertEqual(self.similar(self.posts[0])[0], self.posts[1])
+        # A post without a word in common with any other has no neighbours
+        self.assertEqual(self.similar(self.posts[5]), [])
+
+        lost = Post.objects.create(body='my dog is lost please help find my dog', app_user=self.user).pk
+        Post.objects.filter(pk=self.posts[3]).update(published=False)
+        self.assertEqual(self.build(), (6, 1, 1))
+        self.assertEqual(self.similar(lost)[0], self.posts[2])
+        self.assertEqual(self.similar(self.posts[2])[0], lost)
+        self.assertNotIn(self.posts[3], sum(self.neighbours().values(), []))
+
+        # The incremental build finds the same neighbours as one from scratch
+        incremental = self.neighbours()
+        self.build(full=True)
+        self.assertEqual(self.neighbours(), incremental)
+
+
+class TransferTests(TestCase):
+
+    def setUp(self):
+        users = [AppUser.objects.create(id='user-%d' % i) for i in range(3)]
+        tags = [Tag.objects.create(name='Tag %d' % i, slug='tag-%d' % i) for i in range(3)]
+        users[0].followed_tags.add(*tags[1:])
+        for i in range(5):
+            post = Post.objects.create(body='Post %d' % i, app_user=users[i % 3], published=i != 4)
+            post.tags.add(*tags[:1 + i % 3])
+            post.liked.add(users[(i + 1) % 3])
+            comment = Comment.objects.create(body='Comment %d' % i, app_user=users[i % 3], post=post)
+            comment.disliked.add(users[(i + 2) % 3])
+        archive_posts([post.pk])
+
+    def snapshot(self):
+        # filter() rather than all(), which leaves out unpublished posts and comments
+        return dict((name, sorted(model._default_manager.filter().values_list(*fields)))
+                    for name, model, fields in MODELS)
+
+    def test_round_trip(self):
+        before = self.snapshot()
+        out = StringIO()
+        counts = export_records(out)
+        self.assertEqual(counts['appuser_followed_tags'], 2)
+
+        for name, model, fields in reversed(MODELS):
+            model._default_manager.filter().delete()
+        self.assertFalse(any(self.snapshot().values()))
+
+        import_records(out.getvalue().splitlines())
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(list(Tag.objects.values_list('post_count', flat=True)), [4, 2, 1])
+
+
+class VoteIndexTests(TransactionTestCase):
+    """Transactional, the index is only patched once a vote is committed"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = AppUser.objects.create(id='user-0')
+        self.post = Post.objects.create(body='Post', app_user=self.user)
+        self.comment = Comment.objects.create(body='Comment', app_user=self.user, post=self.post)
+
+    def test_committed_votes_patch_the_index(self):
+        self.assertNotIn(self.post.pk, user_votes('user-0').liked_posts)
+        self.post.liked.add(self.user)
+        self.user.comment_disliked_by.add(self.comment)
+        with self.assertNumQueries(0):
+            state = user_votes('user-0')
+        self.assertIn(self.post.pk, state.liked_posts)
+        self.assertIn(self.comment.pk, state.disliked_comments)
+        self.user.post_liked_by.remove(self.post)
+        with self.assertNumQueries(0):
+            self.assertNotIn(self.post.pk, user_votes('user-0').liked_posts)
+
+    def test_index_built_before_the_commit_is_not_used(self):
+        with transaction.atomic():
+            self.post.liked.add(self.user)
+            # Another request builds the index from the rows as they were
+            generation = caches['default'].get(generation_key('user-0'))
+            caches['default'].set(cache_key('user-0'), (generation, VoteState().dump()))
+        self.assertIn(self.post.pk, user_votes('user-0').liked_posts)
+
+    def test_index_is_rebuilt_after_concurrent_changes(self):
+        user_votes('user-0')
+        # Another change committed in between, the cached arrays are not patched but rebuilt
+        next_generation('user-0')
+        self.post.liked.add(self.user)
+        with self.assertNumQueries(4):
+            self.assertIn(self.post.pk, user_votes('user-0').liked_posts)
+
+
+class SecretKeyTests(TestCase):
+
+    def setUp(self):
+        os.environ.pop('SAFEPOD_TEST_KEY', None)
+        self.addCleanup(os.environ.pop, 'SAFEPOD_TEST_KEY', None)
+        # Pretend keys.json holds the key, and forget what was resolved before
+        self.addCleanup(setattr, secrets, '_keys', secrets._keys)
+        self.addCleanup(secrets._resolved.pop, 'TEST_KEY', None)
+        secrets._keys = {'TEST_KEY': 'from-file'}
+
+    def test_environment_comes_first(self):
+        os.environ['SAFEPOD_TEST_KEY'] = 'from-environment'
+        self.assertEqual(get_secret_key('TEST_KEY'), 'from-environment')
+        self.assertEqual(get_secret_key('TEST_KEY', {'TEST_KEY': 'given'}), 'from-environment')
+
+    def test_keys_file(self):
+        self.assertEqual(get_secret_key('TEST_KEY'), 'from-file')
+        self.assertEqual(get_secret_key('TEST_KEY', {'TEST_KEY': 'given'}), 'given')
+
+    def test_missing_key(self):
+        with self.assertRaises(ImproperlyConfigured) as raised:
+            get_secret_key('MISSING_KEY')
+        self.assertIn('SAFEPOD_MISSING_KEY', str(raised.exception))
+        with self.assertRaises(ImproperlyConfigured):
+            get_secret_key('TEST_KEY', {})
+
+
+class NegotiationTests(TestCase):
+
+    def negotiate(self, accept):
+        return serializers.negotiate(RequestFactory(HTTP_ACCEPT=accept).get('/'))
+
+    @skipIf(serializers.msgpack is None or serializers.cbor2 is None, "needs msgpack and cbor2")
+    def test_first_listed_type_wins(self):
+        self.assertEqual(self.negotiate('application/json, application/msgpack'), serializers.JSON)
+        self.assertEqual(self.negotiate('*/*, application/msgpack'), serializers.JSON)
+        self.assertEqual(self.negotiate('application/msgpack, application/json'), serializers.MSGPACK)
+
+    @skipIf(serializers.msgpack is None or serializers.cbor2 is None, "needs msgpack and cbor2")
+    def test_quality_values(self):
+        self.assertEqual(self.negotiate('application/json, application/msgpack;q=0'), serializers.JSON)
+        self.assertEqual(self.negotiate('application/msgpack;q=0, text/html'), serializers.JSON)
+        self.assertEqual(self.negotiate('application/json;q=0.5, application/cbor'), serializers.CBOR)
+
+    def test_default_is_json(self):
+        self.assertEqual(self.negotiate(''), serializers.JSON)
@@ -0,0 +1,142 @@
+"""
+Streaming export and import of the forum data as NDJSON.
+
+Every line is one JSON object with a "model" key, tags, users and the tags
+they follow first, then posts with their tag and vote links, comments with their vote links
+and archived threads, so an import can insert them in file order. Export
+walks each table in primary key order in batches (Django 1.9 has no
+server-side cursors, keyset batches keep memory constant just the same),
+import buffers up to a batch of rows per model for bulk_create. Both report
+progress through a callback.
+"""
+import gzip
+import json
+import sys
+from contextlib import contextmanager
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from .catalog import rebuild_catalog
+from .models import AppUser, ArchivedThread, Comment, Post, Tag
+
+# Record type, model and exported columns, in import order
+MODELS = [
+    ('tag', Tag, ('id', 'name', 'description', 'slug')),
+    ('appuser', AppUser, ('id', 'banned')),
+    ('appuser_followed_tags', AppUser.followed_tags.through, ('id', 'appuser_id', 'tag_id')),
+    ('post', Post, ('id', 'body', 'published', 'created', 'likes', 'dislikes', 'app_user_id')),
+    ('post_tag', Post.tags.through, ('id', 'post_id', 'tag_id')),
+    ('post_liked', Post.liked.through, ('id', 'post_id', 'appuser_id')),
+    ('post_disliked', Post.disliked.through, ('id', 'post_id', 'appuser_id')),
+    ('comment', Comment, ('id', 'body', 'published', 'created', 'likes', 'dislikes', 'app_user_id', 'post_id')),
+    ('comment_liked', Comment.liked.through, ('id', 'comment_id', 'appuser_id')),
+    ('comment_disliked', Comment.disliked.through, ('id', 'comment_id', 'appuser_id')),
+    ('archived_thread', ArchivedThread, ('id', 'created', 'archived', 'document')),
+]
+
+DATETIME_FIELDS = ('created', 'archived')
+
+MODEL_BY_NAME = dict((name, (model, fields)) for name, model, fields in MODELS)
+
+
+def open_dump(path, mode):
+    """Dump file, gzip compressed if the name ends in .gz, '-' for stdin/stdout"""
+    if path == '-':
+        return sys.stdout if mode == 'w' else sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 'b')
+    return open(path, mode + 'b')
+
+
+def rows(model, fields, batch_size):
+    """All rows of the table as dicts, fetched in primary key order one batch at a time"""
+    queryset = model._default_manager.order_by('pk').values(*fields)
+    last = None
+    while True:
+        batch = list(queryset.filter(pk__gt=last)[:batch_size] if last is not None else queryset[:batch_size])
+        if not batch:
+            return
+        for row in batch:
+            yield row
+        last = batch[-1]['id']
+
+
+def export_records(out, batch_size=2000, progress=None):
+    """Write every record to the file, returns the number of records per type"""
+    counts = {}
+    for name, model, fields in MODELS:
+        count = 0
+        for row in rows(model, fields, batch_size):
+            for field in DATETIME_FIELDS:
+                if row.get(field) is not None:
+                    row[field] = row[field].isoformat()
+            row['model'] = name
+            out.write(json.dumps(row) + '\n')
+            count += 1
+            if progress and count % batch_size == 0:
+                progress(name, count)
+        counts[name] = count
+        if progress:
+            progress(name, count)
+    return counts
+
+
+@contextmanager
+def explicit_timestamps():
+    """Keep the exported creation times instead of stamping the import time"""
+    fields = [field for name, model, columns in MODELS for field in model._meta.fields
+              if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def import_records(lines, batch_size=2000, progress=None):
+    """Insert the records of an export into an empty database, returns the number of records per type"""
+    counts = {}
+    pending = []
+    current = [None]
+
+    def flush():
+        if pending:
+            model = MODEL_BY_NAME[current[0]][0]
+            model.objects.bulk_create(pending)
+            counts[current[0]] = counts.get(current[0], 0) + len(pending)
+            del pending[:]
+            if progress:
+                progress(current[0], counts[current[0]])
+
+    with transaction.atomic(), explicit_timestamps():
+        for line in lines:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            name = row.pop('model')
+            # Records of a type are contiguous and come after those they refer to
+            if name != current[0]:
+                flush()
+                current[0] = name
+            for field in DATETIME_FIELDS:
+                if row.get(field) is not None:
+                    row[field] = parse_datetime(row[field])
+            pending.append(MODEL_BY_NAME[name][0](**row))
+            if len(pending) >= batch_size:
+                flush()
+        flush()
+
+        # Explicit ids leave the sequences behind on Postgres
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), [model for name, model, fields in MODELS])
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+
+    # bulk_create sends no signals, recount the tag catalog once
+    rebuild_catalog()
+    return counts
@@ -1,24 +1,30 @@
-from django.conf.urls import patterns, url
+from django.conf.urls import url
 
-from .views import PostListView, SearchView, AllTagsView, TaggedPostListView, MyPostListView, forum_post, PostDetailView, forum_comment, CommentDetailView
- 
+from safepod_site.lazy import LazyView
+
+# Views are imported on first use, see safepod_site.lazy
 urlpatterns = [
                        # if its a search
-                       url(r'^search/', SearchView.as_view(), name='search'),
+                       url(r'^search/', LazyView('forum.views.SearchView'), name='search'),
                        # Tag views with home page and detailed views
-                       url(r'^tag/(?P<slug>[a-zA-Z0-9-]+)/', TaggedPostListView.as_view(), name='tagged_posts'),
-                       url(r'^tag/', AllTagsView.as_view(), name='all_tags'),
+                       url(r'^tag/(?P<slug>[a-zA-Z0-9-]+)/follow/$', LazyView('forum.views.follow_tag'), name='follow_tag'),
+                       url(r'^tag/(?P<slug>[a-zA-Z0-9-]+)/', LazyView('forum.views.TaggedPostListView'), name='tagged_posts'),
+                       url(r'^tag/', LazyView('forum.views.AllTagsView'), name='all_tags'),
                        
                        # url to handle new post
-                       url(r'^post/new/$', forum_post, name='new_post'),
-                       url(r'^post/my/', MyPostListView.as_view(), name='my_post'),
+                       url(r'^post/new/$', LazyView('forum.views.forum_post'), name='new_post'),
+                       url(r'^post/my/', LazyView('forum.views.MyPostListView'), name='my_post'),
+                       # posts in the tags the user follows
+                       url(r'^post/feed/$', LazyView('forum.views.FeedView'), name='feed'),
+                       # posts similar to a particular post
+                       url(r'^post/(?P<pk>[0-9]+)/similar/$', LazyView('forum.views.SimilarPostListView'), name='similar_posts'),
                        # detailed view of a particular post
-                       url(r'^post/(?P<pk>[0-9]+)/', PostDetailView.as_view(), name='post_detail'),
+                       url(r'^post/(?P<pk>[0-9]+)/', LazyView('forum.views.PostDetailView'), name='post_detail'),
                        
                        # url to handle new comment
-                       url(r'^comment/new/$', forum_comment, name='new_comment'),
-                       url(r'^comment/my/$', forum_comment, name='new_comment'),
-                       url(r'^comment/(?P<pk>[0-9]+)/$', CommentDetailView.as_view(), name='comment_detail'),
+                       url(r'^comment/new/$', LazyView('forum.views.forum_comment'), name='new_comment'),
+                       url(r'^comment/my/$', LazyView('forum.views.forum_comment'), name='new_comment'),
+                       url(r'^comment/(?P<pk>[0-9]+)/$', LazyView('forum.views.CommentDetailView'), name='comment_detail'),
                        
-                       url(r'^', PostListView.as_view(), name='posts_index'),                    
+                       url(r'^', LazyView('forum.views.PostListView'), name='posts_index'),                    
             ]
\ No newline at end of file
@@ -5,49 +5,106 @@ from django.views import generic
 from django.http.response import Http404, HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.core.exceptions import ValidationError
-from django.db.models import Q
-from django.utils.html import escape
+from django.db import transaction
+from django.db.models import F, Q, QuerySet
+from django.utils.decorators import method_decorator
 
-from .models import Post, Tag, Comment, AppUser
+from .models import Post, Tag, Comment, AppUser, ArchivedThread
+from .text import STOPWORDS
+from .archive import archived_post_detail
+from .hotcache import get_post_detail
+from .catalog import tag_catalog
+from .similar import similar_index
+from .feed import forget_feed, user_feed
+from . import serializers
 
-from safepod_site.settings.base import get_secret_key
+from safepod_site.settings.secrets import get_secret_key
 
 # Process the input query string to make sure only legitimate words are used.
 def process_query_string(query_string):
     """Query sanitizer"""
-    stopwords = set([u'i', u'me', u'my', u'myself', u'we', u'our', u'ours', u'ourselves', u'you', u'your', u'yours', u'yourself', u'yourselves', u'he', u'him', u'his', u'himself', u'she', u'her', u'hers', u'herself', u'it', u'its', u'itself', u'they', u'them', u'their', u'theirs', u'themselves', u'what', u'which', u'who', u'whom', u'this', u'that', u'these', u'those', u'am', u'is', u'are', u'was', u'were', u'be', u'been', u'being', u'have', u'has', u'had', u'having', u'do', u'does', u'did', u'doing', u'a', u'an', u'the', u'and', u'but', u'if', u'or', u'because', u'as', u'until', u'while', u'of', u'at', u'by', u'for', u'with', u'about', u'against', u'between', u'into', u'through', u'during', u'before', u'after', u'above', u'below', u'to', u'from', u'up', u'down', u'in', u'out', u'on', u'off', u'over', u'under', u'again', u'further', u'then', u'once', u'here', u'there', u'when', u'where', u'why', u'how', u'all', u'any', u'both', u'each', u'few', u'more', u'most', u'other', u'some', u'such', u'no', u'nor', u'not', u'only', u'own', u'same', u'so', u'than', u'too', u'very', u's', u't', u'can', u'will', u'just', u'don', u'should', u'now'])
     query_string = re.sub(r"[^a-zA-Z0-9\s]",'',query_string.strip())
-    tokens = [word for word in query_string.split() if word.lower() not in stopwords]
+    tokens = [word for word in query_string.split() if word.lower() not in STOPWORDS]
     # Use only the first 10 words to avoid using long string searches
     return tokens[:10]
 
 def check_signature(request):
-    if request.method == 'GET' and 'sign' in request.GET and request.GET.get('sign','') == get_secret_key("APP_ID"):
-        return True
-    else:
-        return False
+    if request.method == 'GET':
+        return 'sign' in request.GET and request.GET.get('sign','') == get_secret_key("APP_ID")
+    
+    # POST requests carry the signature in their JSON body
+    if request.method == 'POST':
+        try:
+            body = json.loads(request.body)
+        except ValueError:
+            return False
+        return isinstance(body, dict) and body.get('sign','') == get_secret_key("APP_ID")
     
-    if request.method == 'POST' and request.body.has_key('sign') and request.body['sign'] == get_secret_key("APP_ID"):
+    return False
+
+# Each vote link, the counter that moves with it, and the opposite vote
+VOTES = (('liked', 'likes', 'disliked', 'dislikes'),
+         ('disliked', 'dislikes', 'liked', 'likes'))
+
+def cast_vote(obj, vote):
+    """
+    Apply the vote in a JSON body to a post or a comment, with its counters.
+
+    {"liked": true} likes it and takes back a dislike, {"liked": false}
+    takes back a like, and the same for "disliked". Voting twice changes
+    nothing. Returns False when the body holds no vote.
+    """
+    app_user = AppUser.objects.get(id=vote['userid'])
+    for field, counter, opposite, opposite_counter in VOTES:
+        if field not in vote:
+            continue
+        add, remove, counters = [], [], {}
+        voted = getattr(obj, field).filter(id=app_user.id).exists()
+        if vote[field] and not voted:
+            add.append(field)
+            counters[counter] = F(counter) + 1
+            if getattr(obj, opposite).filter(id=app_user.id).exists():
+                remove.append(opposite)
+                counters[opposite_counter] = F(opposite_counter) - 1
+        elif not vote[field] and voted:
+            remove.append(field)
+            counters[counter] = F(counter) - 1
+        if counters:
+            with transaction.atomic():
+                type(obj)._default_manager.filter(pk=obj.pk).update(**counters)
+                for name in add:
+                    getattr(obj, name).add(app_user)
+                for name in remove:
+                    getattr(obj, name).remove(app_user)
         return True
-    else:
-        return False
+    return False
 
-# This function converts a give post obj queryset into a standard json response object used by postlistview, searchview and tagview
-def post_objs_to_json(queryset):
+# This function converts a given post obj queryset into the standard list response used by postlistview, searchview and tagview
+def post_objs_to_response(request, queryset):
+    # Tags are listed with every post, fetch them in one query rather than one per post
+    if isinstance(queryset, QuerySet):
+        queryset = queryset.prefetch_related('tags')
+    return serializers.render(request, { 
+                                           'results': serializers.post_summaries(queryset, request.GET.get('userid',''))
+                                       })
+
+# Posts with the given ids, in the order of the ids, skipping those that are gone or unpublished
+def posts_in_order(post_ids):
+    posts = dict((post.pk, post) for post in Post.objects.filter(id__in=post_ids, published=True).prefetch_related('tags'))
+    return [posts[pk] for pk in post_ids if pk in posts]
+
+# The generic views build the queryset (or fetch the object) in get(), before render_to_response could check the signature
+class SignedGetMixin(object):
     
-    results = []
-    for item in queryset:
-        result_obj = {}
-        result_obj['body'] = escape(item.body)[:100]
-        result_obj['id'] = str(item.pk)
-        result_obj['tags'] = []
-        for tag in item.tags.all():
-            result_obj['tags'].append(tag.name)
-        results.append(result_obj)
-        
-    return JsonResponse({ 
-                            'results': results
-                        })
+    # Nothing is looked up before the signature was checked
+    def get(self, request, *args, **kwargs):
+        if not check_signature(request):
+            return JsonResponse({'success':False}, status=400)
+        return self.signed_response()
+    
+    # The posts of get_queryset, unless overridden
+    def signed_response(self):
+        return post_objs_to_response(self.request, self.get_queryset())
 
 
 class PostListView(generic.ListView):
@@ -57,7 +114,7 @@ class PostListView(generic.ListView):
     def render_to_response(self, context, **response_kwargs):  
         if check_signature(self.request):
             queryset = Post.objects.all()[:10]  
-            return post_objs_to_json(queryset)
+            return post_objs_to_response(self.request, queryset)
         else:
             return JsonResponse({'success':False}, status=400)
 
@@ -67,11 +124,24 @@ class MyPostListView(generic.ListView):
     
     def render_to_response(self, context, **response_kwargs):  
         if check_signature(self.request):
-            queryset = Post.objects.filter(app_user__id=self.request.body['userid']) 
-            return post_objs_to_json(queryset)
+            queryset = Post.objects.filter(app_user__id=self.request.GET.get('userid','')) 
+            return post_objs_to_response(self.request, queryset)
         else:
             return JsonResponse({'success':False}, status=400)
 
+class FeedView(SignedGetMixin, generic.ListView):
+    
+    # Newest posts in the tags the user follows, see forum.feed
+    def get_queryset(self):
+        userid = self.request.GET.get('userid','')
+        post_ids = user_feed(userid)
+        posts = posts_in_order(post_ids)
+        if len(posts) < len(post_ids):
+            # Some posts were unpublished or archived since the feed was built, merge it afresh to fill their places
+            forget_feed(userid)
+            posts = posts_in_order(user_feed(userid))
+        return posts
+
 class SearchView(generic.ListView):
 
     def get_queryset(self):
@@ -99,7 +169,7 @@ class SearchView(generic.ListView):
     def render_to_response(self, context, **response_kwargs):  
         if check_signature(self.request):
             queryset = self.get_queryset()   
-            return post_objs_to_json(queryset)
+            return post_objs_to_response(self.request, queryset)
         else:
             return JsonResponse({'success':False}, status=400)
         
@@ -108,20 +178,12 @@ class AllTagsView(generic.ListView):
     
     model = Tag
     
+    # Served from the in-process catalog snapshot, see forum.catalog
     def render_to_response(self, context, **response_kwargs):    
         if check_signature(self.request):
-            queryset = Tag.objects.all()
-            results = []
-            for item in queryset:
-                result_obj = {}
-                result_obj['tag'] = item.name
-                result_obj['slug'] = item.slug
-                result_obj['description'] = item.description
-                results.append(result_obj)
-                
-            return JsonResponse({ 
-                                    'results': results
-                                }, status=200)   
+            return serializers.render(self.request, { 
+                                                        'results': tag_catalog.get()
+                                                    }, status=200)   
         
         else:
             return JsonResponse({'success':False}, status=400)
@@ -145,10 +207,44 @@ class TaggedPostListView(generic.ListView):
     def render_to_response(self, context, **response_kwargs): 
         if check_signature(self.request): 
             queryset = self.get_queryset()   
-            return post_objs_to_json(queryset)
+            return post_objs_to_response(self.request, queryset)
         else:
             return JsonResponse({'success':False}, status=400)
         
+class SimilarPostListView(SignedGetMixin, generic.ListView):
+    
+    # Neighbours come precomputed from the similar posts index, see forum.similar
+    def get_queryset(self):
+        # Most similar first, posts removed since the index was built are skipped
+        return posts_in_order([pk for pk, score in similar_index.similar(self.kwargs['pk'])])
+        
+# Follow or unfollow a tag, its posts then show up in (or leave) the user's feed
+@csrf_exempt
+def follow_tag(request, slug):
+    if not check_signature(request):   
+        return JsonResponse({'success':False}, status=400) 
+
+    if request.method == "POST":
+        follow_obj = json.loads(request.body)
+        tag = get_object_or_404(Tag, slug=slug)
+        try:
+            try:
+                obj = AppUser.objects.get(id=follow_obj['userid'])
+            except AppUser.DoesNotExist:
+                obj = AppUser(id=follow_obj['userid'])
+                obj.save()
+            if follow_obj.get('follow', True):
+                obj.followed_tags.add(tag)
+            else:
+                obj.followed_tags.remove(tag)
+            
+            return JsonResponse({'success':True}, status=200)
+        except:
+            # Failed!
+            return JsonResponse({'success':False}, status=200)
+    else:
+        return JsonResponse({'success':False, 'message': "Use POST request"}, status=200)
+        
 @csrf_exempt
 def forum_post(request):
     if not check_signature(request):   
@@ -180,70 +276,26 @@ def forum_post(request):
         return JsonResponse({'success':False, 'message': "Use POST request"}, status=200)
 
 
-class PostDetailView(generic.DetailView):
+@method_decorator(csrf_exempt, name='dispatch')
+class PostDetailView(SignedGetMixin, generic.DetailView):
     
     model = Post 
     
-    def render_to_response(self, context, **response_kwargs):   
-        if not check_signature(self.request):   
-            return JsonResponse({'success':False}, status=400)
-        
-        postobj = self.get_object()
-        
-        results = {'body': postobj.body,
-                   'id': str(postobj.pk),
-                   'created': postobj.created,
-                   'likes': str(postobj.likes),
-                   'dislikes':str(postobj.dislikes),   
-                   'posted': False,  
-                   'liked': False, 
-                   'disliked': False,               
-                   }
-
-        if postobj.app_user.id==self.request.GET.get('userid',''):
-            results['posted'] = True
-        
-        # If the user has liked the post, then notify
-        if postobj.liked.filter(id=self.request.GET.get('userid','')).exists():
-            results['liked'] = True
-            
-        # If the user has disliked the post, then notify
-        if postobj.disliked.filter(id=self.request.GET.get('userid','')).exists():
-            results['disliked'] = True
-            
-        # Get all the tags
-        results['tags'] = []
-        for tag in postobj.tags.all():
-            results['tags'].append(tag.name)
-        
-        # Get all the comments
-        results['comments'] = []
-        for item in postobj.comment_set.all():
-            result_obj = { 'body': item.body,
-                           'id': str(item.pk),
-                           'created': str(item.created),
-                           'likes': str(item.likes),
-                           'dislikes':str(item.dislikes),   
-                           'posted': False,  
-                           'liked': False, 
-                           'disliked': False,               
-                           }
-            if item.app_user.id==self.request.GET.get('userid',''):
-                result_obj['posted'] = True
-            
-            # If the user has liked the post, then notify
-            if item.liked.filter(id=self.request.GET.get('userid','')).exists():
-                result_obj['liked'] = True
-                
-            # If the user has disliked the post, then notify
-            if item.disliked.filter(id=self.request.GET.get('userid','')).exists():
-                result_obj['disliked'] = True
-            
-            results['comments'].append(result_obj)
+    # The post is looked up here, through the hot post cache or the archive
+    def signed_response(self):
+        # The shared part of the thread comes from the hot post cache, only the user's votes are looked up
+        # Threads moved to cold storage are still served, read-only
+        try:
+            base = get_post_detail(self.kwargs['pk'])
+        except Post.DoesNotExist:
+            thread = get_object_or_404(ArchivedThread, pk=self.kwargs['pk'])
+            results = archived_post_detail(thread, self.request.GET.get('userid',''))
+        else:
+            results = serializers.post_detail_overlay(base, self.request.GET.get('userid',''))
             
-        return JsonResponse({ 
-                                'results': results
-                            }, status=200)        
+        return serializers.render(self.request, { 
+                                                    'results': results
+                                                }, status=200)        
 
    
     def post(self, request, *args, **kwargs):
@@ -256,54 +308,8 @@ class PostDetailView(generic.DetailView):
         vote = json.loads(request.body)
         
         try:
-            app_user = vote['userid']
-            # Handle if post was liked
-            if vote.has_key('liked'):
-                # If the vote is true
-                if vote['liked']:
-                    # Two possibilies. a) This post was either already liked which means it will be ignored
-                    if postobj.liked.filter(id=app_user).exists(): 
-                        pass 
-                    else: # otherwise, update the like and then check the dislike and remove it if it was disliked
-                        postobj.liked.add(AppUser.objects.get(id=app_user))
-                        postobj.likes+=1
-                        # If it was disliked, then remove 
-                        if postobj.disliked.filter(id=app_user).exists(): 
-                            postobj.disliked.remove(AppUser.objects.get(id=app_user))
-                            postobj.disliked-=1
-                else:
-                    # Else unlike the post if already liked
-                    if postobj.liked.filter(id=app_user).exists(): 
-                        postobj.liked.remove(AppUser.objects.get(id=app_user))
-                        postobj.likes-=1 
-                
-                return JsonResponse({'success':True}, status=200) 
-            
-            # Handle if post was disliked
-            if vote.has_key('disliked'):
-                # If the vote is true
-                if vote['disliked']:
-                    # Two possibilies. a) This post was either already disliked which means it will be ignored
-                    if postobj.disliked.filter(id=app_user).exists(): 
-                        pass 
-                    else: # otherwise, update the disliked and then check the like and remove it if it was liked
-                        postobj.disliked.add(AppUser.objects.get(id=app_user))
-                        postobj.dislikes+=1
-                        # If it was liked, then remove 
-                        if postobj.liked.filter(id=app_user).exists(): 
-                            postobj.liked.remove(AppUser.objects.get(id=app_user))
-                            postobj.liked-=1
-                else:
-                    # Else unlike the post if already liked
-                    if postobj.disliked.filter(id=app_user).exists(): 
-                        postobj.disliked.remove(AppUser.objects.get(id=app_user))
-                        postobj.disliked-=1 
-                
-                return JsonResponse({'success':True}, status=200)
-            
-        except:
-            # Do something based on the errors contained in e.message_dict.
-            # Display them to a user, or handle them programmatically.
+            return JsonResponse({'success':cast_vote(postobj, vote)}, status=200)
+        except (KeyError, AppUser.DoesNotExist):
             return JsonResponse({'success':False})                                 
    
 @csrf_exempt
@@ -334,6 +340,7 @@ def forum_comment(request):
     else:
         return JsonResponse({'success':False, 'message': "Use POST request"}, status=200)
 
+@method_decorator(csrf_exempt, name='dispatch')
 class CommentDetailView(generic.DetailView):
     
     model = Comment 
@@ -345,30 +352,11 @@ class CommentDetailView(generic.DetailView):
         
         commentobj = self.get_object()
         
-        results = {'body': commentobj.body,
-                   'id': str(commentobj.pk),
-                   'created': commentobj.created,
-                   'likes': str(commentobj.likes),
-                   'dislikes':str(commentobj.dislikes),   
-                   'posted': False,  
-                   'liked': False, 
-                   'disliked': False,               
-                   }
-
-        if commentobj.app_user.id==self.request.GET.get('userid',''):
-            results['posted'] = True
-        
-        # If the user has liked the comment, then notify
-        if commentobj.liked.filter(id=self.request.GET.get('userid','')).exists():
-            results['liked'] = True
-            
-        # If the user has disliked the comment, then notify
-        if commentobj.disliked.filter(id=self.request.GET.get('userid','')).exists():
-            results['disliked'] = True
+        results = serializers.comment_detail(commentobj, self.request.GET.get('userid',''))
             
-        return JsonResponse({ 
-                                'results': results
-                            }, status=200)        
+        return serializers.render(self.request, { 
+                                                    'results': results
+                                                }, status=200)        
 
    
     def post(self, request, *args, **kwargs):
@@ -381,52 +369,6 @@ class CommentDetailView(generic.DetailView):
         vote = json.loads(request.body)
         
         try:
-            app_user = vote['userid']
-            # Handle if comment was liked
-            if vote.has_key('liked'):
-                # If the vote is true
-                if vote['liked']:
-                    # Two possibilies. a) This comment was either already liked which means it will be ignored
-                    if commentobj.liked.filter(id=app_user).exists(): 
-                        pass 
-                    else: # otherwise, update the like and then check the dislike and remove it if it was disliked
-                        commentobj.liked.add(AppUser.objects.get(id=app_user))
-                        commentobj.likes+=1
-                        # If it was disliked, then remove 
-                        if commentobj.disliked.filter(id=app_user).exists(): 
-                            commentobj.disliked.remove(AppUser.objects.get(id=app_user))
-                            commentobj.disliked-=1
-                else:
-                    # Else unlike the comment if already liked
-                    if commentobj.liked.filter(id=app_user).exists(): 
-                        commentobj.liked.remove(AppUser.objects.get(id=app_user))
-                        commentobj.likes-=1 
-                
-                return JsonResponse({'success':True}, status=200) 
-            
-            # Handle if comment was disliked
-            if vote.has_key('disliked'):
-                # If the vote is true
-                if vote['disliked']:
-                    # Two possibilies. a) This comment was either already disliked which means it will be ignored
-                    if commentobj.disliked.filter(id=app_user).exists(): 
-                        pass 
-                    else: # otherwise, update the disliked and then check the like and remove it if it was liked
-                        commentobj.disliked.add(AppUser.objects.get(id=app_user))
-                        commentobj.dislikes+=1
-                        # If it was liked, then remove 
-                        if commentobj.liked.filter(id=app_user).exists(): 
-                            commentobj.liked.remove(AppUser.objects.get(id=app_user))
-                            commentobj.liked-=1
-                else:
-                    # Else unlike the comment if already liked
-                    if commentobj.disliked.filter(id=app_user).exists(): 
-                        commentobj.disliked.remove(AppUser.objects.get(id=app_user))
-                        commentobj.disliked-=1 
-                
-                return JsonResponse({'success':True}, status=200)
-            
-        except:
-            # Do something based on the errors contained in e.message_dict.
-            # Display them to a user, or handle them programmatically.
-            return JsonResponse({'success':False})   
\ No newline at end of file
+            return JsonResponse({'success':cast_vote(commentobj, vote)}, status=200)
+        except (KeyError, AppUser.DoesNotExist):
+            return JsonResponse({'success':False})
@@ -0,0 +1,158 @@
+"""
+Vote state of a user: which posts and comments they liked or disliked.
+
+Each user's votes are kept as four sorted id arrays (liked and disliked
+posts and comments) in the FORUM_VOTE_CACHE cache, a few bytes per vote, so
+marking the vote state of a whole thread or listing is one cache lookup
+plus binary searches. The arrays are built with four queries on a miss and
+patched by the vote signal receivers in forum.signals once a vote change
+is committed.
+
+Next to the arrays the cache holds a generation counter per user, and the
+arrays are stored with the generation they were built for; both are read in
+the same round trip. Every committed change increments the counter. The
+request that increments it from the generation of the cached arrays
+patches them and stores them under the new generation. When another change
+or a rebuild got in between, the arrays no longer match the counter and the
+next read builds them afresh. Either way arrays built from the database
+while a vote was being changed are never used once that change is committed.
+"""
+import hashlib
+import random
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Comment, Post
+
+KINDS = ('liked_posts', 'disliked_posts', 'liked_comments', 'disliked_comments')
+
+# Vote link table, and the item column, behind every kind
+LINKS = {
+    'liked_posts': (Post.liked.through, 'post_id'),
+    'disliked_posts': (Post.disliked.through, 'post_id'),
+    'liked_comments': (Comment.liked.through, 'comment_id'),
+    'disliked_comments': (Comment.disliked.through, 'comment_id'),
+}
+
+
+class IdSet(object):
+    """Sorted array of ids with set-like membership"""
+
+    def __init__(self, ids=()):
+        self.ids = array('l', sorted(set(ids)))
+
+    def __contains__(self, item):
+        index = bisect_left(self.ids, item)
+        return index < len(self.ids) and self.ids[index] == item
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, item):
+        index = bisect_left(self.ids, item)
+        if index == len(self.ids) or self.ids[index] != item:
+            self.ids.insert(index, item)
+
+    def discard(self, item):
+        index = bisect_left(self.ids, item)
+        if index < len(self.ids) and self.ids[index] == item:
+            self.ids.pop(index)
+
+
+class VoteState(object):
+
+    def __init__(self, liked_posts=(), disliked_posts=(), liked_comments=(), disliked_comments=()):
+        self.liked_posts = IdSet(liked_posts)
+        self.disliked_posts = IdSet(disliked_posts)
+        self.liked_comments = IdSet(liked_comments)
+        self.disliked_comments = IdSet(disliked_comments)
+
+    # Cached as a plain tuple of arrays
+    def dump(self):
+        return tuple(getattr(self, kind).ids for kind in KINDS)
+
+    @classmethod
+    def load(cls, arrays):
+        state = cls()
+        for kind, ids in zip(KINDS, arrays):
+            getattr(state, kind).ids = ids
+        return state
+
+
+def cache():
+    return caches[getattr(settings, 'FORUM_VOTE_CACHE', 'default')]
+
+
+# User ids come from the app and may not be valid cache keys
+def user_hash(userid):
+    return hashlib.md5(userid.encode('utf-8')).hexdigest()
+
+
+def generation_key(userid):
+    return 'forum:votes:generation:%s' % user_hash(userid)
+
+
+def cache_key(userid):
+    return 'forum:votes:%s' % user_hash(userid)
+
+
+# Random rather than 0, so that a counter lost from the cache never matches arrays built long ago
+def new_generation():
+    return random.getrandbits(48)
+
+
+def build_votes(userid):
+    return VoteState(**dict((kind, through.objects.filter(appuser_id=userid).values_list(field, flat=True))
+                            for kind, (through, field) in LINKS.items()))
+
+
+def user_votes(userid):
+    """Everything the user voted on"""
+    if not userid:
+        return VoteState()
+    generation_name, key = generation_key(userid), cache_key(userid)
+    cached = cache().get_many([generation_name, key])
+    generation = cached.get(generation_name)
+    if generation is None:
+        generation = new_generation()
+        if not cache().add(generation_name, generation, None):
+            generation = cache().get(generation_name)
+    elif key in cached and cached[key][0] == generation:
+        return VoteState.load(cached[key][1])
+    state = build_votes(userid)
+    cache().set(key, (generation, state.dump()), getattr(settings, 'FORUM_VOTE_INDEX_TTL', 3600))
+    return state
+
+
+def next_generation(userid):
+    """Increment the user's generation, None if the cache has none (and so no usable arrays)"""
+    try:
+        return cache().incr(generation_key(userid))
+    except ValueError:
+        return None
+
+
+def update_votes(userid, kind, item_ids, voted):
+    """Apply a committed vote change to the cached arrays of the user, if they are current"""
+    generation_name, key = generation_key(userid), cache_key(userid)
+    cached = cache().get_many([generation_name, key])
+    generation = next_generation(userid)
+    if (generation is None or key not in cached or cached.get(generation_name) != generation - 1 or
+            cached[key][0] != generation - 1):
+        return
+    state = VoteState.load(cached[key][1])
+    ids = getattr(state, kind)
+    for item_id in item_ids:
+        if voted:
+            ids.add(item_id)
+        else:
+            ids.discard(item_id)
+    cache().set(key, (generation, state.dump()), getattr(settings, 'FORUM_VOTE_INDEX_TTL', 3600))
+
+
+def forget_votes(userid):
+    """Leave the cached arrays of the user to be built afresh"""
+    next_generation(userid)
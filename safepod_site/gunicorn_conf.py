@@ -0,0 +1,46 @@
+"""
+Gunicorn settings for the production workers.
+
+    gunicorn -c gunicorn_conf.py safepod_site.wsgi_prod    # full site
+    gunicorn -c gunicorn_conf.py safepod_site.wsgi_api     # /forum/ only
+
+The application is imported once in the master and forked into one worker
+process per core; each worker serves SAFEPOD_THREADS requests at a time on
+threads, which overlap database and cache round trips (set it to 1 for
+plain synchronous workers). Workers are recycled after about
+SAFEPOD_MAX_REQUESTS requests, with some jitter so they do not all restart
+together, and get SAFEPOD_GRACEFUL_TIMEOUT seconds to finish what they are
+serving. Every worker thread holds a database connection (CONN_MAX_AGE), so
+size the database for workers x threads x nodes.
+
+Take a node out of rotation by creating HEALTH_DRAIN_FILE, see
+safepod_site/health.py, then restart it once /readyz has failed long
+enough for the load balancer to notice.
+"""
+import multiprocessing
+import os
+
+
+def env(name, default):
+    return int(os.environ.get('SAFEPOD_' + name, default))
+
+
+bind = os.environ.get('SAFEPOD_BIND', '127.0.0.1:8000')
+
+workers = env('WORKERS', multiprocessing.cpu_count())
+threads = env('THREADS', 4)
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = True
+
+max_requests = env('MAX_REQUESTS', 5000)
+max_requests_jitter = env('MAX_REQUESTS_JITTER', 500)
+graceful_timeout = env('GRACEFUL_TIMEOUT', 30)
+timeout = env('TIMEOUT', 30)
+keepalive = env('KEEPALIVE', 5)
+
+
+def pre_fork(server, worker):
+    # A connection opened while preloading would be shared by every worker, drop it first
+    from django.db import connections
+    for connection in connections.all():
+        connection.close()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from home.pages import prerender_pages
+
+
+class Command(BaseCommand):
+    help = "Render the cached pages (landing page, 404) into PRERENDERED_PAGES_DIR, run at deploy"
+
+    def handle(self, *args, **options):
+        for path in prerender_pages():
+            self.stdout.write("Rendered %s" % path)
@@ -0,0 +1,115 @@
+"""
+Rendered page cache for the landing page and the 404 page.
+
+Both pages are static apart from the analytics id, so they are rendered
+once per process, or ahead of time by the prerender_pages command at deploy
+(into PRERENDERED_PAGES_DIR), and kept in memory together with their gzip
+and brotli encodings. Serving a page is then a dict lookup. Edge caches may
+keep the pages for HOME_PAGE_EDGE_MAX_AGE; browsers revalidate with the
+ETag after HOME_PAGE_MAX_AGE. Every encoding is a different representation
+and gets its own strong ETag. With DEBUG on, pages are rendered per request.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from safepod_site.compression import accepted_encodings, brotli, brotli_bytes, gzip_bytes
+from safepod_site.context_processors import google_analytics
+
+# Cached pages and their templates
+PAGES = {
+    'index': 'home/index.html',
+    '404': '404.html',
+}
+
+_pages = {}
+
+
+class RenderedPage(object):
+
+    def __init__(self, body):
+        self.body = body
+        self.encoded = {'gzip': gzip_bytes(body)}
+        if brotli is not None:
+            self.encoded['br'] = brotli_bytes(body)
+        digest = hashlib.md5(body).hexdigest()
+        # The identity body keeps the plain digest, encodings add their name
+        self.etags = dict((encoding, '"%s-%s"' % (digest, encoding)) for encoding in self.encoded)
+        self.etags[None] = '"%s"' % digest
+
+    def encoding_for(self, request):
+        """Content-coding to send the page in, None for none"""
+        for encoding in accepted_encodings(request):
+            if encoding in self.encoded:
+                return encoding
+        return None
+
+
+def render_page(name):
+    # Context processors need a request, the only one the pages use does not
+    return render_to_string(PAGES[name], google_analytics(None)).encode('utf-8')
+
+
+def prerendered_path(name):
+    return os.path.join(settings.PRERENDERED_PAGES_DIR, '%s.html' % name)
+
+
+def load_page(name):
+    """Pre-rendered HTML from deploy time if present, rendered now otherwise"""
+    try:
+        with open(prerendered_path(name), 'rb') as f:
+            return RenderedPage(f.read())
+    except IOError:
+        return RenderedPage(render_page(name))
+
+
+def get_page(name):
+    if settings.DEBUG:
+        return RenderedPage(render_page(name))
+    page = _pages.get(name)
+    if page is None:
+        page = _pages[name] = load_page(name)
+    return page
+
+
+def prerender_pages():
+    """Write every page to PRERENDERED_PAGES_DIR, returns the written paths"""
+    if not os.path.isdir(settings.PRERENDERED_PAGES_DIR):
+        os.makedirs(settings.PRERENDERED_PAGES_DIR)
+    paths = []
+    for name in sorted(PAGES):
+        path = prerendered_path(name)
+        with open(path, 'wb') as f:
+            f.write(render_page(name))
+        paths.append(path)
+    _pages.clear()
+    return paths
+
+
+def page_response(request, name, status=200):
+    page = get_page(name)
+    encoding = page.encoding_for(request)
+    etag = page.etags[encoding]
+
+    if status == 200 and request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(page.body, status=status)
+        if encoding is not None:
+            # Already encoded, so CompressionMiddleware leaves it alone
+            response.content = page.encoded[encoding]
+            response['Content-Encoding'] = encoding
+        response['Content-Length'] = str(len(response.content))
+
+    response['ETag'] = etag
+    if status == 200:
+        patch_cache_control(response, public=True, max_age=settings.HOME_PAGE_MAX_AGE,
+                            s_maxage=settings.HOME_PAGE_EDGE_MAX_AGE)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.HOME_PAGE_MAX_AGE)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -1,3 +1,26 @@
+from django.core.urlresolvers import reverse
 from django.test import TestCase
 
-# Create your tests here.
+from safepod_site.compression import brotli
+
+
+class PageResponseTests(TestCase):
+
+    def get(self, **headers):
+        return self.client.get(reverse('index'), **headers)
+
+    def test_every_encoding_has_its_own_etag(self):
+        encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+        responses = [self.get(HTTP_ACCEPT_ENCODING=encoding) for encoding in encodings]
+        etags = [response['ETag'] for response in responses]
+        self.assertEqual(len(set(etags)), len(encodings))
+        for response, etag in zip(responses, etags):
+            self.assertFalse(etag.startswith('W/'))
+            self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_not_modified_only_for_the_same_encoding(self):
+        etag = self.get(HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        self.assertEqual(self.get(HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.get(HTTP_ACCEPT_ENCODING='identity', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
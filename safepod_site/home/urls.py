@@ -1,7 +1,7 @@
-from django.conf.urls import patterns, url
+from django.conf.urls import url
 
-from .views import HomeView
+from safepod_site.lazy import LazyView
 
 urlpatterns = [
-                       url(r'^$', HomeView.as_view(), name='index'),
+                       url(r'^$', LazyView('home.views.HomeView'), name='index'),
             ]
\ No newline at end of file
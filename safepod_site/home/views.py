@@ -1,5 +1,14 @@
 from django.views import generic
 
+from .pages import page_response
+
+# Served from the rendered page cache, see home.pages
 class HomeView(generic.TemplateView):
     template_name = 'home/index.html'
 
+    def get(self, request, *args, **kwargs):
+        return page_response(request, 'index')
+
+
+def page_not_found(request, exception=None):
+    return page_response(request, '404', status=404)
@@ -0,0 +1,72 @@
+"""
+Static asset serving with precompressed variants and far-future caching.
+
+Serves STATIC_ROOT as laid out by collectstatic with
+safepod_site.storage.PrecompressedManifestStaticFilesStorage: a request for
+a file gets its .webp, .br or .gz sibling when the client accepts it, and
+content-hashed names are marked immutable for a year. Only routed when
+SERVE_STATIC is on, for deployments without a front server doing the same.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.utils.six.moves.urllib.parse import unquote
+from django.views.static import was_modified_since
+
+from .compression import accepted_encodings
+
+# name.0123456789ab.ext as produced by the hashed files storage
+re_hashed = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=3600'
+
+WEBP_SOURCES = ('.jpg', '.jpeg', '.png')
+
+
+def pick_variant(request, fullpath):
+    """Returns the file to send, its content type and content coding"""
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+
+    if fullpath.lower().endswith(WEBP_SOURCES):
+        if 'image/webp' in request.META.get('HTTP_ACCEPT', '') and os.path.isfile(fullpath + '.webp'):
+            return fullpath + '.webp', 'image/webp', None
+        return fullpath, content_type, None
+
+    for encoding in accepted_encodings(request):
+        variant = fullpath + ('.br' if encoding == 'br' else '.gz')
+        if os.path.isfile(variant):
+            return variant, content_type, encoding
+    return fullpath, content_type, None
+
+
+def serve_asset(request, path):
+    path = posixpath.normpath(unquote(path)).lstrip('/')
+    fullpath = safe_join(settings.STATIC_ROOT, path)
+    if not os.path.isfile(fullpath):
+        raise Http404('"%s" does not exist' % path)
+
+    filename, content_type, encoding = pick_variant(request, fullpath)
+    statobj = os.stat(filename)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), statobj.st_mtime, statobj.st_size):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(filename, 'rb'), content_type=content_type)
+        response['Last-Modified'] = http_date(statobj.st_mtime)
+        response['Content-Length'] = statobj.st_size
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['Cache-Control'] = IMMUTABLE if re_hashed.search(path) else REVALIDATE
+    if fullpath.lower().endswith(WEBP_SOURCES):
+        patch_vary_headers(response, ('Accept',))
+    else:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,41 @@
+"""
+Compression shared by the response middleware and the static files pipeline.
+
+Brotli needs the optional brotli package; without it only gzip is used.
+"""
+import gzip
+from io import BytesIO
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def gzip_bytes(data, compresslevel=9):
+    """Deterministic gzip: no file name or timestamp in the header"""
+    buf = BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', compresslevel=compresslevel, fileobj=buf, mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def brotli_bytes(data, quality=11):
+    return brotli.compress(data, quality=quality)
+
+
+def accepted_encodings(request):
+    """Content codings the client accepts, most preferred by us first"""
+    accept = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    offered = set()
+    for coding in accept.split(','):
+        parts = coding.strip().split(';')
+        if any(part.strip() in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000') for part in parts[1:]):
+            continue
+        offered.add(parts[0].strip().lower())
+    encodings = []
+    if brotli is not None and 'br' in offered:
+        encodings.append('br')
+    if 'gzip' in offered or '*' in offered:
+        encodings.append('gzip')
+    return encodings
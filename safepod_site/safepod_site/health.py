@@ -0,0 +1,65 @@
+"""
+Health endpoints for load balancers and process managers.
+
+/healthz says the worker process is up; it touches neither the database nor
+Django. /readyz also pings the database with ``SELECT 1`` on the worker's
+own connection, and answers 503 while the database is unreachable or while
+HEALTH_DRAIN_FILE exists, so that a node can be taken out of rotation
+before it is restarted.
+
+Both are answered by a WSGI wrapper in front of the Django handler (see the
+wsgi modules), so probes skip ALLOWED_HOSTS, URL resolution and the whole
+middleware stack and never show up in request logs or query budgets.
+"""
+import os
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+
+HEADERS = [('Content-Type', 'text/plain'), ('Cache-Control', 'no-store')]
+
+
+def database_ready():
+    # Same connection handling as a request: drop the connection if it is too old or broken
+    close_old_connections()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except DatabaseError:
+        return False
+    return True
+
+
+def draining():
+    drain_file = getattr(settings, 'HEALTH_DRAIN_FILE', None)
+    return bool(drain_file) and os.path.exists(drain_file)
+
+
+def not_ready():
+    """Why the worker should not get traffic, or None"""
+    if draining():
+        return 'draining'
+    if not database_ready():
+        return 'database unavailable'
+    return None
+
+
+def respond(start_response, status, body):
+    start_response(status, HEADERS + [('Content-Length', str(len(body)))])
+    return [body]
+
+
+def with_health_checks(application):
+    """Answer /healthz and /readyz in front of the given WSGI application"""
+    def health_application(environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path == '/healthz':
+            return respond(start_response, '200 OK', b'ok')
+        if path == '/readyz':
+            problem = not_ready()
+            if problem:
+                return respond(start_response, '503 Service Unavailable', problem.encode('ascii'))
+            return respond(start_response, '200 OK', b'ok')
+        return application(environ, start_response)
+    return health_application
@@ -0,0 +1,32 @@
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+
+class LazyView(object):
+    """
+    URL callback that imports its view on first use.
+
+    Keeps importing a URLconf cheap, so a freshly recycled worker only pays
+    for the views it actually serves. Class-based views go through as_view().
+    """
+
+    def __init__(self, dotted_path, **initkwargs):
+        self.dotted_path = dotted_path
+        self.initkwargs = initkwargs
+        # Used by resolve() to name the view
+        self.__module__, self.__name__ = dotted_path.rsplit('.', 1)
+
+    @cached_property
+    def view(self):
+        view = import_string(self.dotted_path)
+        if hasattr(view, 'as_view'):
+            view = view.as_view(**self.initkwargs)
+        return view
+
+    # Checked by CsrfViewMiddleware before the view is called
+    @property
+    def csrf_exempt(self):
+        return getattr(self.view, 'csrf_exempt', False)
+
+    def __call__(self, request, *args, **kwargs):
+        return self.view(request, *args, **kwargs)
@@ -0,0 +1,76 @@
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .compression import accepted_encodings, brotli_bytes, gzip_bytes
+from .querybudget import budget_for, query_budget
+
+re_compressible = re.compile(r'^application/(json|msgpack|cbor)')
+
+
+class CompressionMiddleware(object):
+    """
+    Compress API responses with brotli or gzip.
+
+    Unlike django.middleware.gzip.GZipMiddleware only responses of at least
+    COMPRESSION_MIN_SIZE bytes are touched, since for the small JSON answers
+    (success flags, single comments) the codec costs more than it saves.
+    Brotli is preferred when installed and accepted by the client. Keep it
+    near the top of MIDDLEWARE_CLASSES so it sees the final body.
+
+    HTML and other text responses are left alone: they can reflect request
+    input next to the CSRF token, which compression would expose to BREACH.
+    """
+
+    def process_response(self, request, response):
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+        if not re_compressible.match(response.get('Content-Type', '')):
+            return response
+
+        for encoding in accepted_encodings(request):
+            if encoding == 'br':
+                # Lower quality than for static assets, this runs on every request
+                compressed = brotli_bytes(response.content, quality=5)
+            else:
+                compressed = gzip_bytes(response.content, compresslevel=6)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+            response['Content-Encoding'] = encoding
+            if response.has_header('ETag'):
+                response['ETag'] = re.sub(r'^(W/)?', 'W/', response['ETag'])
+            break
+        return response
+
+
+class QueryBudgetMiddleware(object):
+    """
+    Hold every view to its query budget while DEBUG is on.
+
+    Budgets come from QUERY_BUDGETS by url name (see safepod_site.querybudget);
+    going over one is logged, with the repeated statements by call site, or
+    fails the request when QUERY_BUDGET_FAIL is set. Development settings only.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.DEBUG:
+            return None
+        name = request.resolver_match.url_name if request.resolver_match else None
+        queries, seconds = budget_for(name)
+        request._query_budget = query_budget(queries, seconds, label='%s %s (%s)' % (request.method, request.path, name))
+        request._query_budget.__enter__()
+        return None
+
+    def process_response(self, request, response):
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None:
+            del request._query_budget
+            budget.__exit__(None, None, None)
+        return response
@@ -0,0 +1,154 @@
+"""
+Query budgets: the most queries, and seconds, a block of code may spend.
+
+``query_budget`` works as a context manager or a decorator. Every query run
+inside it is recorded together with the line of project code that ran it;
+when the block goes over its budget the report lists the statements that
+were repeated (literals folded, so ``WHERE id = 1`` and ``WHERE id = 2``
+count as the same statement) grouped by call site, which is usually all it
+takes to spot a query in a loop. Depending on ``fail`` (QUERY_BUDGET_FAIL
+by default) the report is raised as QueryBudgetExceeded or logged.
+
+Budgets of the views are declared in QUERY_BUDGETS by url name, see
+``budget_for``. The forum tests hold every route to its budget, and in
+development QueryBudgetMiddleware (safepod_site.middleware) checks every
+request against it.
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.utils import CursorDebugWrapper
+from django.utils.decorators import ContextDecorator
+
+logger = logging.getLogger('safepod.querybudget')
+
+# Quoted strings and numbers, folded away when grouping statements
+re_literal = re.compile(r"'(?:[^']|'')*'|\b\d+(\.\d+)?\b")
+
+HERE = os.path.splitext(os.path.abspath(__file__))[0]
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def budget_for(view_name):
+    """(queries, seconds) allowed for the view with the given url name"""
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', (None, None)))
+
+
+def call_site():
+    """Innermost frame of project code outside this module, as path:line in function"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(settings.BASE_DIR + os.sep) and os.path.splitext(filename)[0] != HERE:
+            return '%s:%d in %s' % (os.path.relpath(filename, settings.BASE_DIR), frame.f_lineno, frame.f_code.co_name)
+        frame = frame.f_back
+    return 'outside the project'
+
+
+class RecordingCursorWrapper(CursorDebugWrapper):
+    """Debug cursor that also hands every query to the active budgets"""
+
+    def execute(self, sql, params=None):
+        try:
+            return super(RecordingCursorWrapper, self).execute(sql, params)
+        finally:
+            self.record()
+
+    def executemany(self, sql, param_list):
+        try:
+            return super(RecordingCursorWrapper, self).executemany(sql, param_list)
+        finally:
+            self.record()
+
+    def record(self):
+        # CursorDebugWrapper has just logged the query
+        query = self.db.queries_log[-1]
+        entry = (query['sql'], float(query['time']), call_site())
+        for recorded in self.db._query_recorders:
+            recorded.append(entry)
+
+
+class query_budget(ContextDecorator):
+    """
+    Allow the block at most ``queries`` queries and ``seconds`` seconds,
+    None meaning no limit. Budgets nest; each one sees every query run
+    inside it.
+    """
+
+    def __init__(self, queries=None, seconds=None, fail=None, label='', using=DEFAULT_DB_ALIAS):
+        self.max_queries = queries
+        self.max_seconds = seconds
+        self.fail = fail
+        self.label = label
+        self.using = using
+        self.queries = []
+        self.elapsed = 0
+
+    def __enter__(self):
+        connection = connections[self.using]
+        recorders = connection.__dict__.setdefault('_query_recorders', [])
+        if not recorders:
+            connection._force_debug_cursor_was = connection.force_debug_cursor
+            connection.force_debug_cursor = True
+            connection.make_debug_cursor = lambda cursor: RecordingCursorWrapper(cursor, connection)
+        self.queries = []
+        recorders.append(self.queries)
+        self.started = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed = time.time() - self.started
+        connection = connections[self.using]
+        connection._query_recorders[:] = [recorded for recorded in connection._query_recorders
+                                          if recorded is not self.queries]
+        if not connection._query_recorders:
+            del connection.make_debug_cursor
+            connection.force_debug_cursor = connection._force_debug_cursor_was
+        if exc_type is None:
+            self.check()
+
+    def exceeded(self):
+        return ((self.max_queries is not None and len(self.queries) > self.max_queries) or
+                (self.max_seconds is not None and self.elapsed > self.max_seconds))
+
+    def check(self):
+        if not self.exceeded():
+            return
+        fail = self.fail if self.fail is not None else getattr(settings, 'QUERY_BUDGET_FAIL', False)
+        if fail:
+            raise QueryBudgetExceeded(self.report())
+        logger.warning(self.report())
+
+    def report(self):
+        """What the block spent, and the statements it repeated by call site"""
+        budget = []
+        if self.max_queries is not None:
+            budget.append('%d queries' % self.max_queries)
+        if self.max_seconds is not None:
+            budget.append('%ss' % self.max_seconds)
+        lines = ['%s ran %d queries in %.3fs, over its budget of %s' % (
+            self.label or 'Block', len(self.queries), self.elapsed, ' in '.join(budget))]
+
+        statements = OrderedDict()
+        for sql, duration, site in self.queries:
+            statements.setdefault(re_literal.sub('?', sql), []).append(site)
+        repeated = [(len(sites), sql, sites) for sql, sites in statements.items() if len(sites) > 1]
+        repeated.sort(key=lambda item: -item[0])
+        for count, sql, sites in repeated:
+            lines.append('  %dx %s' % (count, sql))
+            for site, site_count in Counter(sites).most_common():
+                lines.append('      %dx from %s' % (site_count, site))
+        if not repeated:
+            lines.append('  No statement was repeated, the slowest were:')
+            for sql, duration, site in sorted(self.queries, key=lambda query: -query[1])[:3]:
+                lines.append('  %.3fs %s\n      from %s' % (duration, sql, site))
+        return '\n'.join(lines)
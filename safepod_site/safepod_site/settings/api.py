@@ -0,0 +1,2 @@
+from .prod import *
+from .lean import *
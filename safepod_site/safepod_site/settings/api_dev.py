@@ -0,0 +1,4 @@
+from .dev import *
+from .lean import *
+
+MIDDLEWARE_CLASSES = ['safepod_site.middleware.QueryBudgetMiddleware'] + MIDDLEWARE_CLASSES
@@ -11,26 +11,15 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 """
 
 import os
-import json
 
-from django.core.exceptions import ImproperlyConfigured
 from django.conf import global_settings
 
+# Keys that are out of version control come from the environment or keys.json
+from .secrets import get_secret_key
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Function to retrieve stored keys that are out of version control
-with open(os.path.join(os.path.dirname(__file__),"keys.json")) as f:
-    keys = json.loads(f.read())
-    
-def get_secret_key(setting_key,secrets=keys):
-    """Get the secret variable or return explicit exception"""
-    try:
-        return keys[setting_key]
-    except KeyError:
-        error_msg = "Set the {0} environment variable".format(setting_key)
-        raise ImproperlyConfigured(error_msg)
-
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/1.9/howto/deployment/checklist/
 
@@ -58,6 +47,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE_CLASSES = [
     'django.middleware.security.SecurityMiddleware',
+    'safepod_site.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -143,5 +133,68 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "static"),
     '/home/abhay/www/safepod/static/',
 ]
+# collectstatic target
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+
+# Serve STATIC_ROOT through safepod_site.assets (precompressed variants, far-future caching)
+SERVE_STATIC = False
+
+# Rendered landing and 404 pages written at deploy by prerender_pages, see home/pages.py
+PRERENDERED_PAGES_DIR = os.path.join(BASE_DIR, 'prerendered')
+
+# Seconds browsers and edge caches may keep the landing page
+HOME_PAGE_MAX_AGE = 300
+HOME_PAGE_EDGE_MAX_AGE = 86400
+
+# Responses smaller than this are never compressed, see safepod_site.middleware
+COMPRESSION_MIN_SIZE = 1024
+
+GOOGLE_ANALYTICS_PROPERTY_ID = 'DUMMY_ANALYTICS_ID'
+
+# Seconds before the in-process tag catalog snapshot is revalidated in the background
+FORUM_TAG_CATALOG_TTL = 60
+
+# Post details kept per worker, and seconds before one is reloaded, see forum/hotcache.py
+FORUM_POST_CACHE_SIZE = 1000
+FORUM_POST_CACHE_TTL = 30
+
+# Cache holding the per-user vote index, and seconds it is kept, see forum/votes.py
+FORUM_VOTE_CACHE = 'default'
+FORUM_VOTE_INDEX_TTL = 3600
+
+# Similar posts index written by build_similar_posts, neighbours kept per post,
+# and seconds between checks for a newer build, see forum/similar.py
+FORUM_SIMILAR_DIR = os.path.join(BASE_DIR, 'similar_index')
+FORUM_SIMILAR_NEIGHBOURS = 10
+FORUM_SIMILAR_CHECK_INTERVAL = 60
+
+# Cache holding tag indexes and feeds, posts per feed, seconds a feed is kept
+# and seconds before newer posts are merged into it, see forum/feed.py
+FORUM_FEED_CACHE = 'default'
+FORUM_FEED_SIZE = 50
+FORUM_FEED_TTL = 300
+FORUM_FEED_REFRESH = 30
+
+# Most queries and seconds a view may spend, by url name, checked by the forum
+# tests and in development by QueryBudgetMiddleware, see safepod_site/querybudget.py
+QUERY_BUDGET_DEFAULT = (20, 1.0)
+QUERY_BUDGETS = {
+    'posts_index': (6, 0.5),
+    'search': (6, 0.5),
+    'all_tags': (1, 0.5),
+    'tagged_posts': (8, 0.5),
+    'my_post': (6, 0.5),
+    'feed': (10, 0.5),
+    'similar_posts': (6, 0.5),
+    # A vote changing sides costs 10, reading a thread much less
+    'post_detail': (10, 0.5),
+    'comment_detail': (10, 0.5),
+    'new_post': (16, 1.0),
+    'new_comment': (6, 1.0),
+    'follow_tag': (5, 1.0),
+}
+# Raise instead of logging a warning when a budget is exceeded
+QUERY_BUDGET_FAIL = False
 
-GOOGLE_ANALYTICS_PROPERTY_ID = 'DUMMY_ANALYTICS_ID'
\ No newline at end of file
+# While this file exists /readyz answers 503 so the node is taken out of rotation, see safepod_site/health.py
+HEALTH_DRAIN_FILE = None
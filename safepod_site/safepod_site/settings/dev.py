@@ -1,3 +1,22 @@
 from .base import *
 
 ALLOWED_HOSTS = ['localhost','127.0.0.1']
+
+# Log views that go over their query budget, see safepod_site/querybudget.py
+MIDDLEWARE_CLASSES = ['safepod_site.middleware.QueryBudgetMiddleware'] + MIDDLEWARE_CLASSES
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'safepod': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
@@ -0,0 +1,43 @@
+"""
+Overrides for API-only worker profiles.
+
+Not a settings module on its own: star-import it after the environment
+settings (see api.py and api_dev.py). API-only workers serve the signed
+JSON endpoints under /forum/ and nothing else, so:
+
+- the admin, auth, sessions, messages and static files apps are left out,
+  which skips admin autodiscovery and the contrib imports at startup;
+- requests bypass the session, auth, CSRF, messages and clickjacking
+  middleware. The endpoints authenticate with the app signature, never
+  read a session and only ever return JSON;
+- templates render with no context processors, and only forum is routed
+  (safepod_site/urls_api.py).
+
+Deployments send /forum/ to workers running this profile and everything
+else to the full profile.
+"""
+
+INSTALLED_APPS = [
+    'forum.apps.ForumConfig',
+]
+
+MIDDLEWARE_CLASSES = [
+    'django.middleware.security.SecurityMiddleware',
+    'safepod_site.middleware.CompressionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+ROOT_URLCONF = 'safepod_site.urls_api'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'DIRS': [],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [],
+        },
+    },
+]
+
+WSGI_APPLICATION = 'safepod_site.wsgi_api.application'
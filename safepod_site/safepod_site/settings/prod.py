@@ -13,10 +13,30 @@ DATABASES = {
                 'PORT': '5432',
                 'USER': get_secret_key("DB_USERNAME"),
                 'PASSWORD': get_secret_key("DB_PASSWORD"),
+                # Every worker thread keeps its connection across requests
+                'CONN_MAX_AGE': 60,
                  }
             }
 
+# One cache shared by all workers on all nodes, so the vote indexes and feeds
+# (forum/votes.py, forum/feed.py) stay the same whichever worker serves a user.
+# Comma separated memcached servers in SAFEPOD_CACHE_LOCATION.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ.get('SAFEPOD_CACHE_LOCATION', '127.0.0.1:11211').split(','),
+        'KEY_PREFIX': 'safepod',
+    }
+}
+
+HEALTH_DRAIN_FILE = os.environ.get('SAFEPOD_DRAIN_FILE', os.path.join(BASE_DIR, 'drain'))
+
 ALLOWED_HOSTS = ['safepodapp.org']
+
+# Hashed names plus gzip/brotli/webp variants written by collectstatic
+STATICFILES_STORAGE = 'safepod_site.storage.PrecompressedManifestStaticFilesStorage'
+
+SERVE_STATIC = True
     
 GOOGLE_ANALYTICS_PROPERTY_ID = get_secret_key('GOOGLE_ANALYTICS_PROPERTY_ID')
 
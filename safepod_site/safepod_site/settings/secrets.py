@@ -0,0 +1,49 @@
+"""
+Loader for the keys that are kept out of version control.
+
+A key is looked up in the environment first, as ``SAFEPOD_<KEY>``, and then
+in settings/keys.json. The file is only read if some key is missing from the
+environment, at most once per process, and resolved keys are memoised since
+some of them (APP_ID) are checked on every request.
+"""
+import os
+import json
+
+from django.core.exceptions import ImproperlyConfigured
+
+ENVIRON_PREFIX = 'SAFEPOD_'
+
+KEYS_FILE = os.path.join(os.path.dirname(__file__), "keys.json")
+
+_keys = None
+_resolved = {}
+
+
+def load_keys():
+    """Read keys.json once, an absent file is treated as empty"""
+    global _keys
+    if _keys is None:
+        try:
+            with open(KEYS_FILE) as f:
+                _keys = json.loads(f.read())
+        except IOError:
+            _keys = {}
+    return _keys
+
+
+def get_secret_key(setting_key, secrets=None):
+    """Get the secret variable or return explicit exception"""
+    if secrets is None and setting_key in _resolved:
+        return _resolved[setting_key]
+
+    value = os.environ.get(ENVIRON_PREFIX + setting_key)
+    if value is None:
+        try:
+            value = (load_keys() if secrets is None else secrets)[setting_key]
+        except KeyError:
+            error_msg = "Set the {0}{1} environment variable".format(ENVIRON_PREFIX, setting_key)
+            raise ImproperlyConfigured(error_msg)
+
+    if secrets is None:
+        _resolved[setting_key] = value
+    return value
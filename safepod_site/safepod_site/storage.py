@@ -0,0 +1,100 @@
+"""
+Static files storage producing cache-friendly variants at collectstatic time.
+
+On top of ManifestStaticFilesStorage (content-hashed names, so they can be
+cached forever) every hashed file also gets:
+
+- .gz and .br siblings for text assets (css, js, svg, ...), kept only if
+  smaller than the original;
+- for JPEG and PNG images, a .webp sibling, and JPEGs are re-encoded as
+  optimised progressive JPEGs when that makes them smaller.
+
+safepod_site.assets.serve_asset picks the best variant per request. Image
+recompression needs the optional Pillow package and brotli the optional
+brotli package; missing ones are skipped.
+"""
+import os
+from io import BytesIO
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+from .compression import brotli, brotli_bytes, gzip_bytes
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.map', '.json', '.txt', '.html', '.xml', '.ico')
+RECOMPRESSIBLE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Files smaller than this are not worth a precompressed sibling
+MIN_COMPRESS_SIZE = 256
+
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, *args, **kwargs):
+        for name, hashed_name, processed in super(PrecompressedManifestStaticFilesStorage, self).post_process(*args, **kwargs):
+            if hashed_name and not isinstance(processed, Exception):
+                self.write_variants(hashed_name)
+            yield name, hashed_name, processed
+
+    def stored_name(self, name):
+        # Templates still reference fallbacks that are not shipped (lib/...),
+        # leave those unhashed instead of failing the whole page
+        try:
+            return super(PrecompressedManifestStaticFilesStorage, self).stored_name(name)
+        except ValueError:
+            return name
+
+    def write_variants(self, name):
+        extension = os.path.splitext(name)[1].lower()
+        if extension in COMPRESSIBLE_EXTENSIONS:
+            self.write_compressed(name)
+        elif extension in RECOMPRESSIBLE_EXTENSIONS and Image is not None:
+            self.write_recompressed(name, extension)
+
+    def write_compressed(self, name):
+        with self.open(name) as f:
+            content = f.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        self.write_if_smaller(name + '.gz', gzip_bytes(content), len(content))
+        if brotli is not None:
+            self.write_if_smaller(name + '.br', brotli_bytes(content), len(content))
+
+    def write_recompressed(self, name, extension):
+        with self.open(name) as f:
+            content = f.read()
+        image = Image.open(BytesIO(content))
+        image.load()
+
+        if extension in ('.jpg', '.jpeg'):
+            progressive = BytesIO()
+            image.save(progressive, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            if len(progressive.getvalue()) < len(content):
+                self.write_file(name, progressive.getvalue())
+
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        webp = BytesIO()
+        try:
+            image.save(webp, 'WEBP', quality=WEBP_QUALITY, method=6)
+        except (IOError, KeyError):
+            # Pillow built without WebP support
+            return
+        self.write_if_smaller(name + '.webp', webp.getvalue(), len(content))
+
+    def write_if_smaller(self, name, content, original_size):
+        if len(content) < original_size:
+            self.write_file(name, content)
+        elif self.exists(name):
+            self.delete(name)
+
+    def write_file(self, name, content):
+        with open(self.path(name), 'wb') as f:
+            f.write(content)
@@ -13,17 +13,32 @@ Including another URLconf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+import re
+
 from django.conf.urls import url, include
-from django.contrib import admin
 from django.conf import settings
 from django.conf.urls.static import static
 
+# The 404 page is served from the rendered page cache, see home/pages.py
+handler404 = 'home.views.page_not_found'
+
 urlpatterns = [
-    url(r'^admin/', admin.site.urls),
     url(r'^', include('home.urls'), name='home'),
     url(r'^forum/', include('forum.urls'),name="forum"),
 ]
 
+# Lean worker profiles leave the admin out, and with it the cost of importing the admin site
+if 'django.contrib.admin' in settings.INSTALLED_APPS:
+    from django.contrib import admin
+    urlpatterns.insert(0, url(r'^admin/', admin.site.urls))
+
+# Precompressed, far-future cached assets, see safepod_site/assets.py
+if settings.SERVE_STATIC:
+    from .assets import serve_asset
+    urlpatterns += [
+        url(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), serve_asset),
+    ]
+
 if settings.DEBUG:
     # Add static and media roots if dev/test
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
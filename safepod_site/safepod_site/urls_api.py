@@ -0,0 +1,9 @@
+"""safepod_site URL Configuration for API-only workers
+
+Only the forum endpoints are routed, see settings/lean.py.
+"""
+from django.conf.urls import url, include
+
+urlpatterns = [
+    url(r'^forum/', include('forum.urls'),name="forum"),
+]
@@ -13,4 +13,7 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "safepod_site.settings.dev")
 
-application = get_wsgi_application()
+from safepod_site.health import with_health_checks
+
+# /healthz and /readyz are answered before Django, see safepod_site/health.py
+application = with_health_checks(get_wsgi_application())
@@ -0,0 +1,16 @@
+"""
+WSGI config for the API-only workers of the safepod project.
+
+It exposes the WSGI callable as a module-level variable named ``application``.
+These workers serve /forum/ with the lean settings profile, see
+safepod_site/settings/lean.py.
+"""
+
+import os
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "safepod_site.settings.api")
+
+from django.core.wsgi import get_wsgi_application
+from safepod_site.health import with_health_checks
+
+# /healthz and /readyz are answered before Django, see safepod_site/health.py
+application = with_health_checks(get_wsgi_application())
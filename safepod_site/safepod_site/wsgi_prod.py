@@ -11,4 +11,7 @@ import os
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "safepod_site.settings.prod")
 
 from django.core.wsgi import get_wsgi_application
-application = get_wsgi_application()
+from safepod_site.health import with_health_checks
+
+# /healthz and /readyz are answered before Django, see safepod_site/health.py
+application = with_health_checks(get_wsgi_application())